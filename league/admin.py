@@ -1,10 +1,15 @@
 from django.contrib import admin, messages
+from django.db.models import Q
 from django.shortcuts import redirect, render
 from django.urls import path
+from django.utils import timezone
 from django.utils.html import format_html
 
-from .forms import MatchGenerationForm, SegmentForm
+from .forms import MatchGenerationForm, SegmentForm, SegmentInlineFormSet
+from .jobs import enqueue, stale_jobs_condition
+from .signals import deferred_match_updates
 from .models import (
+    Job,
     League,
     LeagueTable,
     Match,
@@ -57,6 +62,7 @@ class LeagueTableInline(admin.TabularInline):
 class SegmentScoreInline(admin.TabularInline):
     model = SegmentScore
     form = SegmentForm
+    formset = SegmentInlineFormSet
     extra = 0  # No extra blank segments
     min_num = 7  # Ensure at least 7 segments are shown (D1-D5 and S1-S2)
     max_num = 7
@@ -73,30 +79,55 @@ class SegmentScoreInline(admin.TabularInline):
         "away_players",
     ]
 
+    def get_queryset(self, request):
+        # The segment labels, running totals and selected players, read once
+        # for the formset
+        return (
+            super()
+            .get_queryset(request)
+            .with_running_totals()
+            .select_related("match__home_team", "match__away_team")
+            .prefetch_related("home_players", "away_players")
+        )
+
 
 # Season admin
 def generate_matches_view(request, season_id):
     season = Season.objects.get(pk=season_id)
+    plan = None
 
     if request.method == "POST":
         form = MatchGenerationForm(request.POST)
         if form.is_valid():
             start_date = form.cleaned_data["start_date"]
             interval_days = form.cleaned_data["interval_days"]
-
-            result_message = season.generate_matches(
-                start_date, interval_days
-            )  # Call the method on the season
-            messages.success(request, result_message)
-
-            return redirect(
-                "admin:league_season_changelist"
-            )  # Redirect to the season list
+            legs = form.cleaned_data["legs"]
+
+            plan = season.plan_matches(start_date, interval_days, legs)
+            if "preview" not in request.POST:
+                if plan:
+                    # Writing the schedule is left to the job queue worker
+                    enqueue(
+                        "generate_matches",
+                        season_id=season.pk,
+                        start_date=start_date.isoformat(),
+                        interval_days=interval_days,
+                        legs=legs,
+                    )
+                    messages.success(request, f"Match generation queued for {season}.")
+                else:
+                    messages.error(request, f"Season {season} has insufficient teams.")
+
+                return redirect(
+                    "admin:league_season_changelist"
+                )  # Redirect to the season list
     else:
         form = MatchGenerationForm()
 
     return render(
-        request, "admin/generate_matches.html", {"form": form, "season": season}
+        request,
+        "admin/generate_matches.html",
+        {"form": form, "season": season, "plan": plan},
     )
 
 
@@ -168,5 +199,38 @@ class MatchAdmin(admin.ModelAdmin):
     search_fields = ["home_team__name", "away_team__name"]  # Search by team name
     inlines = [SegmentScoreInline]  # Show segments inline on the match detail page
 
+    def save_related(self, request, form, formsets, change):
+        # Conclude the match once for all segments of the inline
+        with deferred_match_updates():
+            super().save_related(request, form, formsets, change)
+
 
 admin.site.register(Venue)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "task",
+        "status",
+        "attempts",
+        "run_after",
+        "locked_until",
+        "updated_at",
+    )
+    list_filter = ("status", "task")
+    readonly_fields = ("created_at", "updated_at", "last_error")
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        # Running jobs are left to their worker until their lease ends
+        now = timezone.now()
+        queryset.filter(
+            ~Q(status=Job.Status.RUNNING) | stale_jobs_condition(now)
+        ).update(
+            status=Job.Status.PENDING,
+            attempts=0,
+            run_after=now,
+            locked_until=None,
+        )
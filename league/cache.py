@@ -0,0 +1,146 @@
+"""
+Versioned caching of the public league pages.
+
+Every season has a data version stored in the cache, and one more version
+covers all seasons. Cached page content is keyed by that version, so changing
+the data of a season only needs a new version: stale entries are never read
+again and simply expire. The teams, venues and players, shown on the pages of
+every season, have a shared version that is part of every key.
+
+Only the content of a page is cached, never the surrounding layout, which holds
+the CSRF token of the visitor.
+
+The `a`-prefixed helpers are the versions for async views, on the async API
+of the cache backend.
+"""
+
+import hashlib
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.translation import get_language
+
+ALL_SEASONS = "all"
+SHARED_DATA = "shared"
+PAGE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(season_id):
+    return f"league:data-version:{season_id}"
+
+
+def get_data_version(season_id=ALL_SEASONS):
+    # A random version cannot match entries cached before it was evicted
+    return cache.get_or_set(_version_key(season_id), lambda: uuid4().hex, None)
+
+
+async def aget_data_version(season_id=ALL_SEASONS):
+    return await cache.aget_or_set(_version_key(season_id), lambda: uuid4().hex, None)
+
+
+def bump_data_version(season_id):
+    """
+    Invalidate the cached pages of a season and of all seasons.
+    """
+    cache.set_many(
+        {
+            _version_key(season_id): uuid4().hex,
+            _version_key(ALL_SEASONS): uuid4().hex,
+        },
+        None,
+    )
+
+
+def bump_shared_data_version():
+    """
+    Invalidate the cached pages of every season.
+    """
+    cache.set(_version_key(SHARED_DATA), uuid4().hex, None)
+
+
+def _page_cache_key(request, season_id, data_version, shared_version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return ":".join(
+        [
+            "league:page",
+            str(season_id),
+            data_version,
+            shared_version,
+            # Pages choosing what to show by date change at midnight
+            timezone.now().date().isoformat(),
+            get_language() or "",
+            "htmx" if request.htmx else "page",
+            # Live scores are only part of the pages served over ASGI
+            "asgi" if isinstance(request, ASGIRequest) else "wsgi",
+            path,
+        ]
+    )
+
+
+def page_cache_key(request, season_id=ALL_SEASONS):
+    """
+    Return the cache key of the content of the requested page.
+    """
+    return _page_cache_key(
+        request,
+        season_id,
+        get_data_version(season_id),
+        get_data_version(SHARED_DATA),
+    )
+
+
+async def apage_cache_key(request, season_id=ALL_SEASONS):
+    return _page_cache_key(
+        request,
+        season_id,
+        await aget_data_version(season_id),
+        await aget_data_version(SHARED_DATA),
+    )
+
+
+def cached_value(request, build, season_id=ALL_SEASONS):
+    """
+    Return the value built for the requested page, from the cache while the
+    data is unchanged. `build` is only called on a cache miss.
+    """
+    return cache.get_or_set(page_cache_key(request, season_id), build, PAGE_TIMEOUT)
+
+
+def cached_content(request, template_name, get_context, season_id=ALL_SEASONS):
+    """
+    Return the rendered template, from the cache while the data is unchanged.
+    `get_context` is only called when the content has to be rendered.
+    """
+    return cached_value(
+        request,
+        lambda: render_to_string(template_name, get_context(), request),
+        season_id,
+    )
+
+
+async def acached_value(request, build, season_id=ALL_SEASONS):
+    """
+    Async version of cached_value(), `build` being a coroutine function.
+    """
+    key = await apage_cache_key(request, season_id)
+    value = await cache.aget(key)
+    if value is None:
+        value = await build()
+        await cache.aset(key, value, PAGE_TIMEOUT)
+    return value
+
+
+async def acached_content(request, template_name, get_context, season_id=ALL_SEASONS):
+    """
+    Async version of cached_content(), `get_context` being a coroutine
+    function. The context must be fully loaded, as rendering runs on the event
+    loop where the ORM cannot be used.
+    """
+
+    async def build():
+        return render_to_string(template_name, await get_context(), request)
+
+    return await acached_value(request, build, season_id)
@@ -0,0 +1,246 @@
+"""
+Conditional GET for the public league pages.
+
+A page is validated by the latest `updated_at` of the rows it shows, teams,
+venues and players included, read with a single query. The ETag also covers
+what the response depends on besides the data: the language, htmx partials and
+the visitor. A client that already has the current version gets a 304 without
+the page being rendered.
+
+Async views are validated with the async counterparts of the validators, which
+share their queries.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.db.models import F, Func, OuterRef, Q, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from .models import (
+    LeagueTable,
+    Match,
+    MatchDay,
+    Player,
+    SeasonTeam,
+    Season,
+    Team,
+    Venue,
+)
+
+
+def latest_update(queryset):
+    """
+    Subquery of the latest modification time of the rows of a queryset.
+    """
+    # A plain MAX() keeps the subquery free of a GROUP BY clause
+    return Subquery(
+        queryset.order_by()
+        .annotate(latest=Func(F("updated_at"), function="MAX"))
+        .values("latest")[:1]
+    )
+
+
+def _latest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps, default=None)
+
+
+async def aactive_league_last_modified(**kwargs):
+    row = await (
+        Season.objects.filter(active=True, league__type="regular")
+        .annotate(
+            match_days_updated_at=latest_update(
+                MatchDay.objects.filter(season=OuterRef("pk"))
+            ),
+            matches_updated_at=latest_update(
+                Match.objects.filter(match_day__season=OuterRef("pk"))
+            ),
+            standings_updated_at=latest_update(
+                LeagueTable.objects.filter(match_day__season=OuterRef("pk"))
+            ),
+            teams_updated_at=latest_update(Team.objects.filter(seasons=OuterRef("pk"))),
+        )
+        .values_list(
+            "match_days_updated_at",
+            "matches_updated_at",
+            "standings_updated_at",
+            "teams_updated_at",
+        )
+        .afirst()
+    )
+    return _latest(*row) if row else None
+
+
+def _match_day_updates(match_day_id):
+    return (
+        MatchDay.objects.filter(pk=match_day_id)
+        .annotate(
+            matches_updated_at=latest_update(
+                Match.objects.filter(match_day=OuterRef("pk"))
+            ),
+            teams_updated_at=latest_update(
+                Team.objects.filter(
+                    Q(home_matches__match_day=OuterRef("pk"))
+                    | Q(away_matches__match_day=OuterRef("pk"))
+                )
+            ),
+        )
+        .values_list("updated_at", "matches_updated_at", "teams_updated_at")
+    )
+
+
+def match_day_last_modified(match_day_id, **kwargs):
+    row = _match_day_updates(match_day_id).first()
+    return _latest(*row) if row else None
+
+
+async def amatch_day_last_modified(match_day_id, **kwargs):
+    row = await _match_day_updates(match_day_id).afirst()
+    return _latest(*row) if row else None
+
+
+def match_last_modified(pk, **kwargs):
+    row = (
+        Match.objects.filter(pk=pk)
+        .annotate(
+            teams_updated_at=latest_update(
+                Team.objects.filter(
+                    Q(home_matches=OuterRef("pk")) | Q(away_matches=OuterRef("pk"))
+                )
+            ),
+            venue_updated_at=latest_update(
+                Venue.objects.filter(team__home_matches=OuterRef("pk"))
+            ),
+            players_updated_at=latest_update(
+                Player.objects.filter(
+                    Q(home_segments__match=OuterRef("pk"))
+                    | Q(away_segments__match=OuterRef("pk"))
+                )
+            ),
+        )
+        .values_list(
+            "updated_at",
+            "teams_updated_at",
+            "venue_updated_at",
+            "players_updated_at",
+        )
+        .first()
+    )
+    return _latest(*row) if row else None
+
+
+def team_last_modified(team_id, **kwargs):
+    row = (
+        Team.objects.filter(pk=team_id)
+        .annotate(
+            squads_updated_at=latest_update(
+                SeasonTeam.objects.filter(team=OuterRef("pk"), season__active=True)
+            ),
+            matches_updated_at=latest_update(
+                Match.objects.filter(
+                    Q(home_team=OuterRef("pk")) | Q(away_team=OuterRef("pk")),
+                    match_day__season__active=True,
+                )
+            ),
+            # The opponents are among the teams of the same active seasons
+            teams_updated_at=latest_update(
+                Team.objects.filter(seasons__active=True, seasons__teams=OuterRef("pk"))
+            ),
+            venue_updated_at=latest_update(Venue.objects.filter(team=OuterRef("pk"))),
+            players_updated_at=latest_update(
+                Player.objects.filter(
+                    teams__team=OuterRef("pk"), teams__season__active=True
+                )
+            ),
+        )
+        .values_list(
+            "updated_at",
+            "squads_updated_at",
+            "matches_updated_at",
+            "teams_updated_at",
+            "venue_updated_at",
+            "players_updated_at",
+        )
+        .first()
+    )
+    return _latest(*row) if row else None
+
+
+def page_etag(request, last_modified, user):
+    """
+    Return the ETag of a page whose data was last modified at `last_modified`.
+    """
+    parts = [
+        last_modified.isoformat(),
+        get_language() or "",
+        "htmx" if request.htmx else "page",
+        str(user.pk or ""),
+    ]
+    return quote_etag(hashlib.md5(":".join(parts).encode()).hexdigest())
+
+
+def _set_validators(response, etag, timestamp):
+    if response.status_code == 200:
+        response.headers.setdefault("ETag", etag)
+        response.headers.setdefault("Last-Modified", http_date(timestamp))
+    return response
+
+
+def conditional_page(get_last_modified):
+    """
+    Decorator answering a conditional GET of a page with a 304 while its data
+    is unchanged. `get_last_modified` receives the keyword arguments of the URL,
+    and is a coroutine function for an async view.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view(request, *args, **kwargs)
+
+                last_modified = await get_last_modified(**kwargs)
+                if last_modified is None:
+                    return await view(request, *args, **kwargs)
+
+                etag = page_etag(request, last_modified, await request.auser())
+                timestamp = int(last_modified.timestamp())
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=timestamp
+                )
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    _set_validators(response, etag, timestamp)
+                return response
+
+            return inner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            last_modified = get_last_modified(**kwargs)
+            if last_modified is None:
+                return view(request, *args, **kwargs)  # Let the view raise a 404
+
+            etag = page_etag(request, last_modified, request.user)
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                _set_validators(response, etag, timestamp)
+            return response
+
+        return inner
+
+    return decorator
@@ -1,5 +1,5 @@
-from django.db.models import Q
 from django.forms import TextInput
+from django.urls import reverse_lazy
 from league.forms import PlayerFilterForm
 from league.models import Player
 import django_filters as df
@@ -14,6 +14,12 @@ class PlayerFilter(df.FilterSet):
                 "placeholder": "Search players",
                 "class": "dark:bg-gray-700 dark:text-white dark:border-black",
                 "id": "player-input",
+                # Suggestions under the input, next to the filtered table
+                "autocomplete": "off",
+                "hx-get": reverse_lazy("player_autocomplete"),
+                "hx-trigger": "keyup changed delay:250ms",
+                "hx-target": "#player-suggestions",
+                "hx-swap": "outerHTML",
             }
         ),
     )
@@ -37,9 +43,7 @@ class PlayerFilter(df.FilterSet):
 
     def filter_by_name(self, queryset, name, value):
         """
-        Custom method to filter by first name or last name.
+        Custom method to filter by the start of "first last" or "last first".
         This allows searching for either first or last name in one field.
         """
-        return queryset.filter(
-            Q(first_name__icontains=value) | Q(last_name__icontains=value)
-        )
+        return queryset.search(value)
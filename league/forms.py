@@ -1,10 +1,15 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.forms import BaseInlineFormSet, BaseModelFormSet
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Column, Div, Layout, Row, Submit
 
-from league.models import SegmentScore, SeasonTeam
+from league.lineups import validate_lineups
+from league.models import Player, SegmentScore
 
 
 class MatchGenerationForm(forms.Form):
@@ -14,6 +19,11 @@ class MatchGenerationForm(forms.Form):
     interval_days = forms.IntegerField(
         label="Interval between match days (in days)", initial=7, min_value=1
     )
+    legs = forms.IntegerField(
+        label="Number of legs (each team plays each other team once per leg)",
+        initial=2,
+        min_value=1,
+    )
 
 
 class PlayerFilterForm(forms.Form):
@@ -29,6 +39,81 @@ class PlayerFilterForm(forms.Form):
         )
 
 
+def load_rosters(match):
+    """
+    Return the home and away players of the season teams of a match, keyed by
+    the lineup field they can be picked in, read with a single query.
+    """
+    players = {match.home_team_id: [], match.away_team_id: []}
+    for player in (
+        Player.objects.filter(
+            teams__season__match_days=match.match_day_id,
+            teams__team_id__in=players,
+        )
+        .annotate(roster_team_id=F("teams__team_id"))
+        .order_by("last_name", "first_name", "pk")
+    ):
+        players[player.roster_team_id].append(player)
+    return {
+        "home_players": players[match.home_team_id],
+        "away_players": players[match.away_team_id],
+    }
+
+
+class RosterChoiceField(forms.ModelMultipleChoiceField):
+    """
+    Multiple choice of players, validated against the evaluated roster of
+    the form when it has one instead of querying the selected players.
+    """
+
+    roster = None
+
+    def _check_values(self, value):
+        if self.roster is None:
+            return super()._check_values(value)
+        players = {}
+        for pk in value:
+            try:
+                player = self.roster.get(int(pk))
+            except (TypeError, ValueError):
+                raise ValidationError(
+                    self.error_messages["invalid_pk_value"],
+                    code="invalid_pk_value",
+                    params={"pk": pk},
+                )
+            if player is None:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": pk},
+                )
+            players[player.pk] = player
+        return list(players.values())
+
+
+class LoadedSegmentField(forms.ModelChoiceField):
+    """
+    Hidden primary key field of a segment form, resolved among the segments
+    loaded by the formset instead of with a query per form.
+    """
+
+    def __init__(self, segments, *args, **kwargs):
+        self.segments = segments
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.segments[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
 class SegmentForm(forms.ModelForm):
     class Meta:
         model = SegmentScore
@@ -42,45 +127,36 @@ class SegmentForm(forms.ModelForm):
             "home_players": forms.CheckboxSelectMultiple,  # Example of customizing the widget
             "away_players": forms.CheckboxSelectMultiple,
         }
+        field_classes = {
+            "home_players": RosterChoiceField,
+            "away_players": RosterChoiceField,
+        }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, rosters=None, **kwargs):
         super(SegmentForm, self).__init__(*args, **kwargs)
 
-        try:
-            match = self.instance.match
-
-            # Filter home_players to only include players from the home team in the correct season
-            season = match.match_day.season  # Get the season from the match_day
-            home_team = match.home_team
-            away_team = match.away_team
-
-            # Filter home players
-            home_season_team = SeasonTeam.objects.get(season=season, team=home_team)
-            self.fields["home_players"].queryset = home_season_team.players.all()
+        if rosters is None:
+            try:
+                rosters = load_rosters(self.instance.match)
+            except SegmentScore.match.RelatedObjectDoesNotExist:
+                return
 
-            # Filter away players
-            away_season_team = SeasonTeam.objects.get(season=season, team=away_team)
-            self.fields["away_players"].queryset = away_season_team.players.all()
-        except SegmentScore.match.RelatedObjectDoesNotExist:
-            pass
+        for field_name, roster in rosters.items():
+            field = self.fields[field_name]
+            # The evaluated roster validates the submitted players and renders
+            # the widget, so neither needs a query of its own
+            field.roster = {player.pk: player for player in roster}
+            field.queryset = Player.objects.filter(pk__in=field.roster)
+            field.choices = [(player.pk, str(player)) for player in roster]
 
     def clean(self):
         cleaned_data = super().clean()
         home_score = cleaned_data.get("home_score") or 0
         away_score = cleaned_data.get("away_score") or 0
         segment_number = self.instance.segment_number
-        home_players = cleaned_data.get("home_players")
-        away_players = cleaned_data.get("away_players")
-        segment_type = self.instance.segment_type
-        match = self.instance.match
 
         self.validate_scores(home_score, away_score, segment_number)
-
-        self.validate_player_count(segment_type, home_players, "home")
-        self.validate_player_count(segment_type, away_players, "away")
-
-        self.validate_player_participation(home_players, match, "home")
-        self.validate_player_participation(away_players, match, "away")
+        # The lineups are validated by the formset, against all segments at once
         return cleaned_data
 
     def validate_scores(self, home_score, away_score, segment_number):
@@ -96,60 +172,6 @@ class SegmentForm(forms.ModelForm):
                 f"Score cannot exceed {max_score} for segment {segment_number}."
             )
 
-    def validate_player_count(self, segment_type, players, team):
-        """
-        Validates that singles segments have exactly 1 player and doubles segments have exactly 2 players.
-        """
-        if segment_type.startswith("S") and players.count() > 1:
-            raise forms.ValidationError(
-                f"{team.capitalize()} team must have exactly 1 player for singles segment {segment_type}."
-            )
-        elif segment_type.startswith("D") and players.count() not in [0, 2]:
-            raise forms.ValidationError(
-                f"{team.capitalize()} team must have exactly 2 players for doubles segment {segment_type}."
-            )
-
-    def validate_player_participation(self, players, match, team_type):
-        """
-        Validates that players are not playing more than allowed in restricted segments.
-        """
-        for player in players.all():
-            conflicting_segments = SegmentScore.objects.filter(
-                match=match, **{f"{team_type}_players": player}
-            ).exclude(
-                pk=self.instance.pk
-            )  # Exclude the current segment being validated
-
-            # Track player participation in restricted groups
-            participation_tracker = {
-                "group1": set(),
-                "group2": set(),
-                "group3": set(),
-            }
-
-            for segment in conflicting_segments:
-                if segment.segment_type in SegmentScore.SEGMENT_GROUPS["group1"]:
-                    participation_tracker["group1"].add(segment.segment_type)
-                elif segment.segment_type in SegmentScore.SEGMENT_GROUPS["group2"]:
-                    participation_tracker["group2"].add(segment.segment_type)
-                elif segment.segment_type in SegmentScore.SEGMENT_GROUPS["group3"]:
-                    participation_tracker["group3"].add(segment.segment_type)
-
-            # Add current segment type to the tracker
-            if self.instance.segment_type in SegmentScore.SEGMENT_GROUPS["group1"]:
-                participation_tracker["group1"].add(self.instance.segment_type)
-            elif self.instance.segment_type in SegmentScore.SEGMENT_GROUPS["group2"]:
-                participation_tracker["group2"].add(self.instance.segment_type)
-            elif self.instance.segment_type in SegmentScore.SEGMENT_GROUPS["group3"]:
-                participation_tracker["group3"].add(self.instance.segment_type)
-
-            # Check if any player plays more than once in a restricted group
-            for group, participation in participation_tracker.items():
-                if len(participation) > 1:
-                    raise forms.ValidationError(
-                        f"Player {player} cannot participate in multiple segments of the same group ({', '.join(participation)})."
-                    )
-
 
 class SegmentLineupForm(SegmentForm):
     class Meta(SegmentForm.Meta):
@@ -160,6 +182,66 @@ class SegmentLineupForm(SegmentForm):
         }
 
 
+class RosterFormSetMixin:
+    """
+    Load the rosters of the match once per formset and share them between
+    its segment forms, instead of every form and widget querying them again.
+    The lineups of all forms are validated together once they are cleaned.
+    """
+
+    def get_match(self):
+        """
+        Return the match of the segments, taken from the first one loaded.
+        """
+        segment = next(iter(self.segments.values()), None)
+        return segment.match if segment else None
+
+    @cached_property
+    def segments(self):
+        return {segment.pk: segment for segment in self.get_queryset()}
+
+    @cached_property
+    def rosters(self):
+        match = self.get_match()
+        if match is None:
+            # Without a saved match there are no players to pick yet
+            return {"home_players": [], "away_players": []}
+        return load_rosters(match)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs["rosters"] = self.rosters
+        return kwargs
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        pk_name = self.model._meta.pk.name
+        pk_field = form.fields[pk_name]
+        form.fields[pk_name] = LoadedSegmentField(
+            self.segments,
+            pk_field.queryset,
+            initial=pk_field.initial,
+            required=False,
+            widget=pk_field.widget,
+        )
+
+    def clean(self):
+        super().clean()
+        validate_lineups(self.forms, self.get_match())
+
+
+class SegmentFormSet(RosterFormSetMixin, BaseModelFormSet):
+    """
+    Formset over the segments of one match.
+    """
+
+
+class SegmentInlineFormSet(RosterFormSetMixin, BaseInlineFormSet):
+    def get_match(self):
+        # The match being edited, even before its segments are loaded
+        return self.instance if self.instance.pk else None
+
+
 class SegmentScoreForm(forms.ModelForm):
     class Meta:
         model = SegmentScore
@@ -1,42 +1,93 @@
-from .models import LeagueTable, Match
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
 
+from .cache import bump_data_version
+from .models import (
+    LeagueTable,
+    Match,
+    MatchDay,
+    Player,
+    PlayerSeasonStats,
+    SegmentScore,
+)
 
+STAT_FIELDS = ("played", "wins", "draws", "losses", "goals_for", "goals_against")
+HISTORY_FIELDS = ("position", "points", "goal_difference")
+PLAYER_STAT_FIELDS = (
+    "singles_played",
+    "singles_won",
+    "singles_lost",
+    "doubles_played",
+    "doubles_won",
+    "doubles_lost",
+    "points_for",
+    "points_against",
+)
+
+
+@transaction.atomic
 def update_standings_for_new_match_day(current_match_day):
-    previous_standings_queryset = LeagueTable.objects.get_previous_standings(
-        current_match_day
-    )
+    """
+    Rebuild the standings snapshot of a match day with a fixed number of queries.
+    """
+    previous_standings = {
+        standing.team_id: standing
+        for standing in LeagueTable.objects.get_previous_standings(current_match_day)
+    }
     matches = Match.objects.filter(
         match_day=current_match_day, status=Match.Status.FINISHED
     )
-    update_standings_from_matches(
-        matches, previous_standings_queryset, current_match_day
+    standings = update_standings_from_matches(
+        matches, previous_standings, current_match_day
     )
-    set_team_positions(current_match_day)
+    set_team_positions(standings)
+
+    # The deleted rows keep their match day, read by the post_delete signals
+    current_match_day.team_standings.all().delete()
+    LeagueTable.objects.bulk_create(standings)
+    bump_data_version(current_match_day.season_id)
 
 
-def update_standings_from_matches(matches, standings_queryset, current_match_day):
+def update_standings_from_matches(matches, previous_standings, current_match_day):
     """
-    Update standings based on the matches of the current match day.
+    Build the unsaved standings of the current match day from the previous
+    standings (keyed by team id) and the scores of the matches played.
     """
+    standings = {
+        team_id: carry_forward(standing, current_match_day)
+        for team_id, standing in previous_standings.items()
+    }
     for match in matches:
-        home_team_standing = standings_queryset.filter(
-            team=match.home_team
-        ).first() or LeagueTable(team=match.home_team)
-        away_team_standing = standings_queryset.filter(
-            team=match.away_team
-        ).first() or LeagueTable(team=match.away_team)
+        for team_id in (match.home_team_id, match.away_team_id):
+            standings.setdefault(
+                team_id, LeagueTable(team_id=team_id, match_day=current_match_day)
+            )
 
-        home_team_standing.pk = None
-        away_team_standing.pk = None
+        increment_team_stats(
+            standings[match.home_team_id], match.home_score, match.away_score
+        )
+        increment_team_stats(
+            standings[match.away_team_id], match.away_score, match.home_score
+        )
 
-        home_team_standing.match_day = current_match_day
-        away_team_standing.match_day = current_match_day
+    return list(standings.values())
 
-        increment_team_stats(home_team_standing, match.home_score, match.away_score)
-        increment_team_stats(away_team_standing, match.away_score, match.home_score)
 
-        home_team_standing.save()
-        away_team_standing.save()
+def carry_forward(standing, match_day):
+    """
+    Copy a standing into a new, unsaved row for the given match day.
+    """
+    return LeagueTable(
+        team_id=standing.team_id,
+        match_day=match_day,
+        played=standing.played,
+        wins=standing.wins,
+        draws=standing.draws,
+        losses=standing.losses,
+        goals_for=standing.goals_for,
+        goals_against=standing.goals_against,
+    )
 
 
 def increment_team_stats(team_standing, goals_for, goals_against):
@@ -55,13 +106,256 @@ def increment_team_stats(team_standing, goals_for, goals_against):
         team_standing.draws += 1
 
 
-def set_team_positions(match_day):
+def standing_sort_key(standing):
     """
-    Set the position of each team in the standings for the specified match day.
+    Sort key matching LeagueTable ordering, usable on unsaved rows whose
+    generated columns have not been computed by the database yet.
     """
-    sorted_standings = LeagueTable.objects.filter(match_day=match_day).order_by(
-        "-points", "-goal_difference", "-goals_for"
-    )
+    points = standing.wins * 3 + standing.draws
+    goal_difference = standing.goals_for - standing.goals_against
+    return (-points, -goal_difference, -standing.goals_for)
+
+
+def set_team_positions(standings):
+    """
+    Set the position of each team in the given standings of one match day.
+    """
+    sorted_standings = sorted(standings, key=standing_sort_key)
     for position, standing in enumerate(sorted_standings, start=1):
         standing.position = position
-        standing.save()
+
+
+@transaction.atomic
+def repair_standings_for_matches(matches):
+    """
+    Apply corrected results of finished matches to the standings of their match
+    day and of every later match day of the season.
+
+    The result that was counted for a match is read back from the difference
+    between its match day snapshot and the previous one, so a repair is
+    idempotent and several corrections compose in any order.
+    """
+    corrected_match_days = [
+        match.match_day for match in matches if apply_result_correction(match)
+    ]
+    if not corrected_match_days:
+        return
+
+    first_match_day = min(corrected_match_days, key=lambda day: day.round_number)
+    standings_by_match_day = {}
+    for standing in LeagueTable.objects.filter(
+        match_day__in=later_match_days(first_match_day)
+    ):
+        standings_by_match_day.setdefault(standing.match_day_id, []).append(standing)
+
+    now = timezone.now()
+    for standings in standings_by_match_day.values():
+        set_team_positions(standings)
+        for standing in standings:
+            standing.updated_at = now
+    LeagueTable.objects.bulk_update(
+        [row for rows in standings_by_match_day.values() for row in rows],
+        ["position", "updated_at"],
+    )
+    bump_data_version(first_match_day.season_id)
+
+
+def apply_result_correction(match):
+    """
+    Add the difference between the current and the counted result of a match
+    to the standings of both teams, from its match day onwards.
+
+    Returns whether the standings changed.
+    """
+    match_day = match.match_day
+    team_ids = (match.home_team_id, match.away_team_id)
+    # Locking reads serialize concurrent corrections of the same match
+    home_score, away_score = (
+        Match.objects.select_for_update()
+        .values_list("home_total", "away_total")
+        .get(pk=match.pk)
+    )
+    standings = {
+        standing.team_id: standing
+        for standing in LeagueTable.objects.select_for_update().filter(
+            match_day=match_day, team_id__in=team_ids
+        )
+    }
+    if len(standings) != 2:
+        return False  # No snapshot has been built for the match day yet
+
+    previous_standings = {
+        standing.team_id: standing
+        for standing in LeagueTable.objects.get_previous_standings(match_day).filter(
+            team_id__in=team_ids
+        )
+    }
+
+    home_result, away_result = LeagueTable(), LeagueTable()
+    increment_team_stats(home_result, home_score, away_score)
+    increment_team_stats(away_result, away_score, home_score)
+
+    deltas = {}
+    for team_id, result in zip(team_ids, (home_result, away_result)):
+        previous = previous_standings.get(team_id, LeagueTable())
+        counted = {
+            field: getattr(standings[team_id], field) - getattr(previous, field)
+            for field in STAT_FIELDS
+        }
+        deltas[team_id] = {
+            field: getattr(result, field) - counted[field] for field in STAT_FIELDS
+        }
+
+    if not any(any(delta.values()) for delta in deltas.values()):
+        return False
+
+    LeagueTable.objects.filter(
+        match_day__in=later_match_days(match_day), team_id__in=team_ids
+    ).update(
+        **{
+            field: F(field)
+            + Case(
+                *[
+                    When(team_id=team_id, then=Value(delta[field]))
+                    for team_id, delta in deltas.items()
+                ],
+                default=Value(0),
+            )
+            for field in STAT_FIELDS
+        },
+        updated_at=timezone.now(),
+    )
+    return True
+
+
+def later_match_days(match_day):
+    """
+    Return the given match day and every later match day of its season.
+    """
+    return MatchDay.objects.filter(
+        season_id=match_day.season_id, round_number__gte=match_day.round_number
+    )
+
+
+def build_standings_history(season_id):
+    """
+    Build the teams x rounds matrix of position, points and goal difference of
+    a season from a single query. Rounds without standings yet are left out,
+    and a team missing from a round has None values for it.
+    """
+    rows = (
+        LeagueTable.objects.filter(match_day__season_id=season_id)
+        .order_by("match_day__round_number", "team_id")
+        .values_list(
+            "match_day__round_number",
+            "team_id",
+            "team__name",
+            "position",
+            "points",
+            "goal_difference",
+        )
+    )
+
+    rounds = []
+    teams = {}
+    for round_number, team_id, team_name, *values in rows:
+        if not rounds or rounds[-1] != round_number:
+            rounds.append(round_number)
+        team = teams.setdefault(
+            team_id,
+            {"id": team_id, "name": team_name}
+            | {field: [] for field in HISTORY_FIELDS},
+        )
+        for field, value in zip(HISTORY_FIELDS, values):
+            series = team[field]
+            # Pad the rounds in which the team had no standing
+            series.extend([None] * (len(rounds) - 1 - len(series)))
+            series.append(value)
+
+    for team in teams.values():
+        for field in HISTORY_FIELDS:
+            team[field].extend([None] * (len(rounds) - len(team[field])))
+
+    return {"season": season_id, "rounds": rounds, "teams": list(teams.values())}
+
+
+def segment_player_ids(**segment_filters):
+    """
+    Return the ids of the players lined up, on either side, in the segments
+    matching the filters.
+    """
+    return {
+        player_id
+        for side in ("home", "away")
+        for player_id in getattr(SegmentScore, f"{side}_players")
+        .through.objects.filter(
+            **{f"segmentscore__{key}": value for key, value in segment_filters.items()}
+        )
+        .values_list("player_id", flat=True)
+    }
+
+
+@transaction.atomic
+def refresh_player_stats(player_ids, season_ids):
+    """
+    Recompute the statistics of the given players in the given seasons from
+    their scored segments. Only the rows of these players are rewritten, so
+    the cost follows the size of the change rather than of the season.
+    """
+    player_ids, season_ids = set(player_ids), set(season_ids)
+    if not player_ids or not season_ids:
+        return
+
+    # Serialize concurrent refreshes of the same players
+    list(
+        Player.objects.select_for_update()
+        .filter(pk__in=player_ids)
+        .order_by("pk")
+        .values_list("pk")
+    )
+
+    stats = {}
+    for side, opponent in (("home", "away"), ("away", "home")):
+        rows = (
+            getattr(SegmentScore, f"{side}_players")
+            .through.objects.filter(
+                player_id__in=player_ids,
+                segmentscore__match__match_day__season_id__in=season_ids,
+                segmentscore__home_score__isnull=False,
+                segmentscore__away_score__isnull=False,
+            )
+            .values("player_id", season=F("segmentscore__match__match_day__season_id"))
+            .annotate(**_player_stat_aggregates(side, opponent))
+        )
+        for row in rows:
+            counts = stats.setdefault(
+                (row["player_id"], row["season"]), dict.fromkeys(PLAYER_STAT_FIELDS, 0)
+            )
+            for field in PLAYER_STAT_FIELDS:
+                counts[field] += row[field] or 0
+
+    PlayerSeasonStats.objects.filter(
+        player_id__in=player_ids, season_id__in=season_ids
+    ).delete()
+    PlayerSeasonStats.objects.bulk_create(
+        [
+            PlayerSeasonStats(player_id=player_id, season_id=season_id, **counts)
+            for (player_id, season_id), counts in stats.items()
+        ]
+    )
+
+
+def _player_stat_aggregates(side, opponent):
+    opponent_score = F(f"segmentscore__{opponent}_score")
+    won = Q(**{f"segmentscore__{side}_score__gt": opponent_score})
+    lost = Q(**{f"segmentscore__{side}_score__lt": opponent_score})
+    aggregates = {
+        "points_for": Sum(f"segmentscore__{side}_score"),
+        "points_against": Sum(f"segmentscore__{opponent}_score"),
+    }
+    for kind, prefix in (("S", "singles"), ("D", "doubles")):
+        is_kind = Q(segmentscore__segment_type__startswith=kind)
+        aggregates[f"{prefix}_played"] = Count("pk", filter=is_kind)
+        aggregates[f"{prefix}_won"] = Count("pk", filter=is_kind & won)
+        aggregates[f"{prefix}_lost"] = Count("pk", filter=is_kind & lost)
+    return aggregates
@@ -0,0 +1,164 @@
+"""
+A small job queue stored in the database.
+
+Heavy work is enqueued as a Job row and run by ``manage.py run_jobs`` outside
+of the request that triggered it. Identical pending jobs are only stored once.
+
+A claimed job is leased to its worker for JOB_LEASE. A job still running when
+its lease ends was left by a worker that stopped, and is claimed again.
+"""
+
+import hashlib
+import json
+import logging
+import traceback
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .helper import update_standings_for_new_match_day
+from .models import Job, MatchDay, Season
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+JOB_LEASE = timedelta(minutes=15)
+LOST_JOB_ERROR = "The worker running the job stopped before it finished."
+
+
+def register(func):
+    """
+    Register a function as a task that can be enqueued by its name.
+    """
+    TASKS[func.__name__] = func
+    return func
+
+
+def job_dedupe_key(task, arguments):
+    return hashlib.sha1(
+        json.dumps([task, arguments], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def enqueue(task, **arguments):
+    """
+    Add a job for a registered task, unless an identical one is already pending.
+    """
+    if task not in TASKS:
+        raise ValueError(f"Unknown task {task}.")
+
+    dedupe_key = job_dedupe_key(task, arguments)
+    try:
+        with transaction.atomic():
+            job, _ = Job.objects.get_or_create(
+                dedupe_key=dedupe_key,
+                defaults={"task": task, "arguments": arguments},
+            )
+    except IntegrityError:
+        # An identical job was enqueued concurrently
+        job = Job.objects.get(dedupe_key=dedupe_key)
+    return job
+
+
+def stale_jobs_condition(now):
+    """
+    Condition for the running jobs whose lease has ended.
+    """
+    return Q(status=Job.Status.RUNNING) & (
+        Q(locked_until__lt=now) | Q(locked_until__isnull=True)
+    )
+
+
+def claim_next_job():
+    """
+    Mark the next due job as running and return it, or None if there is none.
+    Jobs left running by a stopped worker are claimed again, or failed once
+    they used all their attempts.
+    """
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Job.Status.PENDING, run_after__lte=now)
+                    | stale_jobs_condition(now)
+                )
+                .first()
+            )
+            if job is None:
+                return None
+
+            if job.status == Job.Status.RUNNING:
+                job.last_error = LOST_JOB_ERROR
+                logger.warning("Job %s was left running, claiming it again.", job.pk)
+                if job.attempts >= job.max_attempts:
+                    job.status = Job.Status.FAILED
+                    job.locked_until = None
+                    job.save()
+                    continue
+
+            job.status = Job.Status.RUNNING
+            job.attempts += 1
+            job.locked_until = now + JOB_LEASE
+            job.dedupe_key = None  # New identical jobs may be enqueued from now on
+            job.save()
+        return job
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome, scheduling a retry on failure.
+    A job waiting for its retry is pending again, and deduplicates new
+    identical jobs like any pending job.
+    """
+    try:
+        with transaction.atomic():
+            TASKS[job.task](**job.arguments)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.PENDING
+            job.dedupe_key = job_dedupe_key(job.task, job.arguments)
+            job.run_after = timezone.now() + timedelta(
+                seconds=30 * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = Job.Status.FAILED
+        logger.exception("Job %s failed (attempt %s).", job.pk, job.attempts)
+    else:
+        job.status = Job.Status.DONE
+    job.locked_until = None
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # An identical job was enqueued while this one ran and does its work
+        job.status = Job.Status.FAILED
+        job.dedupe_key = None
+        job.save()
+
+
+def run_pending_jobs():
+    """
+    Run due jobs until none is left and return how many were run.
+    """
+    count = 0
+    while job := claim_next_job():
+        run_job(job)
+        count += 1
+    return count
+
+
+@register
+def update_standings(match_day_id):
+    update_standings_for_new_match_day(MatchDay.objects.get(pk=match_day_id))
+
+
+@register
+def generate_matches(season_id, start_date, interval_days, legs):
+    Season.objects.get(pk=season_id).generate_matches(
+        date.fromisoformat(start_date), interval_days, legs
+    )
@@ -0,0 +1,120 @@
+"""
+Validation of the lineups of a match.
+
+The lineups are held in memory as one bitset per player and side, bit n
+standing for segment number n, so a player lined up more than once in a
+segment group shows up as more than one bit under the mask of the group. The
+saved lineups are read with a single query and overlaid with the submitted
+ones, so the forms of a formset are checked against each other rather than
+against the state they are about to replace.
+"""
+
+from django.db.models import Value
+
+from .models import SegmentScore
+
+SIDES = ("home", "away")
+SEGMENT_NUMBERS = {
+    segment_type.value: number
+    for number, segment_type in enumerate(SegmentScore.SegmentType, start=1)
+}
+SEGMENT_TYPES = {
+    number: segment_type for segment_type, number in SEGMENT_NUMBERS.items()
+}
+GROUP_MASKS = {
+    group: sum(1 << SEGMENT_NUMBERS[segment_type] for segment_type in segment_types)
+    for group, segment_types in SegmentScore.SEGMENT_GROUPS.items()
+}
+
+
+def saved_lineups(match):
+    """
+    Return the saved lineups of a match as player ids keyed by side and
+    segment number.
+    """
+    home_query, away_query = (
+        getattr(SegmentScore, f"{side}_players")
+        .through.objects.filter(segmentscore__match=match)
+        .annotate(side=Value(side))
+        .values_list("side", "segmentscore__segment_number", "player_id")
+        for side in SIDES
+    )
+    lineups = {}
+    for side, segment_number, player_id in home_query.union(away_query, all=True):
+        lineups.setdefault((side, segment_number), set()).add(player_id)
+    return lineups
+
+
+def group_conflicts(lineups):
+    """
+    Yield the side, player id and segment numbers of every player lined up
+    in more than one segment of a group.
+    """
+    bitsets = {}
+    for (side, segment_number), player_ids in lineups.items():
+        for player_id in player_ids:
+            key = (side, player_id)
+            bitsets[key] = bitsets.get(key, 0) | 1 << segment_number
+
+    for (side, player_id), bitset in bitsets.items():
+        for group_mask in GROUP_MASKS.values():
+            overlap = bitset & group_mask
+            if overlap.bit_count() > 1:
+                yield side, player_id, [
+                    number
+                    for number in SEGMENT_NUMBERS.values()
+                    if overlap >> number & 1
+                ]
+
+
+def player_count_error(segment_type, count, side):
+    """
+    Return the error of a lineup of `count` players for a segment, if any.
+    """
+    if segment_type.startswith("S") and count > 1:
+        return f"{side.capitalize()} team must have exactly 1 player for singles segment {segment_type}."
+    if segment_type.startswith("D") and count not in (0, 2):
+        return f"{side.capitalize()} team must have exactly 2 players for doubles segment {segment_type}."
+    return None
+
+
+def validate_lineups(forms, match=None):
+    """
+    Check the player counts and segment groups of the lineups submitted in
+    the segment forms of a match, and add the errors to the forms concerned.
+    The lineups of the segments without a valid form are read from the
+    database, with a single query.
+    """
+    lineups = saved_lineups(match) if match is not None else {}
+    forms_by_number = {}
+    player_names = {}
+
+    for form in forms:
+        segment = form.instance
+        if not hasattr(form, "cleaned_data") or segment.segment_number is None:
+            continue
+        if form.cleaned_data.get("DELETE"):
+            for side in SIDES:
+                lineups.pop((side, segment.segment_number), None)
+            continue
+
+        forms_by_number[segment.segment_number] = form
+        for side in SIDES:
+            players = form.cleaned_data.get(f"{side}_players")
+            if players is None:
+                continue  # Not submitted or invalid, the saved lineup stands
+            lineups[side, segment.segment_number] = {player.pk for player in players}
+            player_names.update((player.pk, str(player)) for player in players)
+            error = player_count_error(segment.segment_type, len(players), side)
+            if error:
+                form.add_error(None, error)
+
+    for side, player_id, numbers in group_conflicts(lineups):
+        message = (
+            f"Player {player_names.get(player_id, player_id)} cannot participate in "
+            f"multiple segments of the same group "
+            f"({', '.join(SEGMENT_TYPES[number] for number in numbers)})."
+        )
+        for number in numbers:
+            if number in forms_by_number:
+                forms_by_number[number].add_error(None, message)
@@ -0,0 +1,180 @@
+"""
+Live score updates pushed to spectators as Server-Sent Events.
+
+The SegmentScore and Match signals publish every committed score and status
+change to an in-process broker. Each open event stream subscribes to the
+topic of its match or match day, so a change is encoded once and fanned out
+to all viewers instead of each of them polling for a full render.
+
+The broker lives in the memory of the process: behind several ASGI workers a
+viewer only hears of the changes saved by the worker serving its stream.
+
+Live scores need an ASGI server (e.g. uvicorn or daphne serving
+``ts_manager.asgi``). Under WSGI and ``runserver`` an async streaming body is
+read to its end before being sent, so an endless stream would hold a worker
+thread forever without ever sending an event. There the pages leave out the
+event source and the streams answer 204 No Content, which tells browsers not
+to reconnect.
+"""
+
+import asyncio
+import json
+import threading
+from functools import partial
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+MAX_PENDING_EVENTS = 100
+
+
+def live_scores_enabled(request):
+    """
+    Whether the request is served over ASGI, where event streams can stay open.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def match_topic(match_id):
+    return f"match:{match_id}"
+
+
+def match_day_topic(match_day_id):
+    return f"match-day:{match_day_id}"
+
+
+def encode_event(event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+class Subscription:
+    """
+    The queue of events of one stream, fed from any thread and read on the
+    event loop of the stream.
+    """
+
+    def __init__(self, topic, loop):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True  # Too slow a reader, its stream is closed
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.put, message)
+        except RuntimeError:
+            pass  # The loop of the stream is closed
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, topic):
+        subscription = Subscription(topic, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.topic, None)
+
+    def subscriber_count(self, topic):
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+    def publish(self, topics, event, data):
+        """
+        Send an event to the subscribers of the given topics, encoded once.
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for topic in topics
+                for subscription in self._subscriptions.get(topic, ())
+            ]
+        if not subscriptions:
+            return
+        message = encode_event(event, data)
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+
+broker = Broker()
+
+
+def publish_on_commit(topics, event, data):
+    """
+    Publish an event once the current transaction commits, so that viewers
+    never see a change that is rolled back.
+    """
+    transaction.on_commit(partial(broker.publish, topics, event, data))
+
+
+def publish_segment(segment):
+    publish_on_commit(
+        [match_topic(segment.match_id)],
+        "segment",
+        {
+            "match": segment.match_id,
+            "segment": segment.segment_number,
+            "home_score": segment.home_score,
+            "away_score": segment.away_score,
+        },
+    )
+
+
+def publish_match(match):
+    publish_on_commit(
+        [match_topic(match.pk), match_day_topic(match.match_day_id)],
+        "match",
+        {
+            "match": match.pk,
+            "status": match.status,
+            "status_display": match.get_status_display(),
+            "home_score": match.home_score,
+            "away_score": match.away_score,
+        },
+    )
+
+
+async def stream_events(topic):
+    subscription = broker.subscribe(topic)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+        while not subscription.overflowed:
+            try:
+                yield await asyncio.wait_for(
+                    subscription.queue.get(), KEEPALIVE_SECONDS
+                )
+            except TimeoutError:
+                yield b": keep-alive\n\n"  # Keeps proxies from closing the stream
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def event_stream_response(request, topic):
+    if not live_scores_enabled(request):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        stream_events(topic), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Not buffered by an nginx proxy
+    return response
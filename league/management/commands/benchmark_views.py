@@ -0,0 +1,224 @@
+import asyncio
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from league.models import Player, Season
+
+UNCACHED = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def default_urls():
+    """
+    Return the public pages of the active league served by the async views.
+    """
+    season = Season.objects.filter(active=True, league__type="regular").first()
+    if season is None:
+        raise CommandError("There is no active league season to request.")
+    match_day = season.match_days.order_by("round_number").first()
+    player = Player.objects.filter(season_stats__season=season).first()
+    urls = [
+        reverse("home"),
+        reverse("active_league"),
+        reverse("match_day_list", args=[season.pk]),
+    ]
+    if match_day is not None:
+        urls.append(reverse("match_day_detail", args=[match_day.pk]))
+    if player is not None:
+        urls.append(reverse("player_detail", args=[player.pk]))
+    return urls
+
+
+def call_wsgi(application, url, host):
+    parts = urlsplit(url)
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": parts.path,
+        "QUERY_STRING": parts.query,
+        "SERVER_NAME": host,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": host,
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+    }
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    response = application(environ, start_response)
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()  # Ends the request, as a WSGI server does
+    return statuses[0]
+
+
+async def call_asgi(application, url, host):
+    parts = urlsplit(url)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "root_path": "",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "headers": [(b"host", host.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": (host, 80),
+    }
+    statuses = []
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            # The client never disconnects, the handler stops listening
+            await asyncio.get_running_loop().create_future()
+        body_sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+async def run_load(send_request, urls, total, concurrency):
+    """
+    Send `total` requests over the URLs from `concurrency` clients, each one
+    sending its next request as soon as it got a response. Return the elapsed
+    time, the latencies and the number of failed requests.
+    """
+    for url in urls:
+        await send_request(url)  # Warm up the templates and connections
+
+    pending = iter(range(total))
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        for index in pending:
+            start = time.perf_counter()
+            status = await send_request(urls[index % len(urls)])
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+async def load_wsgi(urls, host, total, concurrency, threads):
+    application = get_wsgi_application()
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+
+        def send_request(url):
+            return loop.run_in_executor(pool, call_wsgi, application, url, host)
+
+        return await run_load(send_request, urls, total, concurrency)
+
+
+async def load_asgi(urls, host, total, concurrency):
+    application = get_asgi_application()
+
+    def send_request(url):
+        return call_asgi(application, url, host)
+
+    return await run_load(send_request, urls, total, concurrency)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the public pages served by the WSGI handler "
+        "on a pool of worker threads and by the ASGI handler on an event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Number of requests sent to each handler.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=200,
+            help="Number of clients waiting for a response at the same time.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Worker threads of the WSGI handler, as in a threaded WSGI server.",
+        )
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="Page to request, can be repeated. Defaults to the public "
+            "pages of the active league.",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host of the requests, which must be in ALLOWED_HOSTS.",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Bypass the page cache, so that every request reads the database.",
+        )
+
+    def handle(self, *args, **options):
+        urls = options["urls"] or default_urls()
+        host = options["host"]
+        total, concurrency = options["requests"], options["concurrency"]
+        self.stdout.write(
+            f"Sending {total} requests from {concurrency} clients to "
+            f"{', '.join(urls)}."
+        )
+
+        uncached = override_settings(CACHES=UNCACHED)
+        with uncached if options["no_cache"] else nullcontext():
+            wsgi = asyncio.run(
+                load_wsgi(urls, host, total, concurrency, options["threads"])
+            )
+            self.report(f"WSGI ({options['threads']} threads)", *wsgi)
+            asgi = asyncio.run(load_asgi(urls, host, total, concurrency))
+            self.report("ASGI", *asgi)
+
+        speedup = wsgi[0] / asgi[0]
+        self.stdout.write(self.style.SUCCESS(f"ASGI throughput: {speedup:.2f}x WSGI."))
+
+    def report(self, name, elapsed, latencies, errors):
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{name}: {len(latencies) / elapsed:.0f} requests/s, latency "
+            f"p50 {percentiles[49] * 1000:.1f} ms, "
+            f"p95 {percentiles[94] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms, {errors} errors."
+        )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from league.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the jobs of the background job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the pending jobs and exit instead of polling for new ones.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f"Ran {count} jobs.")
+            if options["once"]:
+                return
+            time.sleep(options["sleep"])
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from league.models import Match, segment_total
+
+
+class Command(BaseCommand):
+    help = "Backfill the denormalized match totals from the segment scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report matches whose totals are out of sync.",
+        )
+
+    def handle(self, *args, **options):
+        out_of_sync = (
+            Match.objects.annotate(
+                expected_home_total=segment_total("home_score"),
+                expected_away_total=segment_total("away_score"),
+            )
+            .filter(
+                ~Q(home_total=F("expected_home_total"))
+                | ~Q(away_total=F("expected_away_total"))
+            )
+            .select_related("home_team", "away_team")
+        )
+
+        if options["check"]:
+            mismatches = list(out_of_sync)
+            for match in mismatches:
+                self.stdout.write(
+                    f"{match}: stored {match.home_total}-{match.away_total}, "
+                    f"expected {match.expected_home_total}-{match.expected_away_total}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} match totals are out of sync.")
+            self.stdout.write(self.style.SUCCESS("All match totals are in sync."))
+            return
+
+        updated = Match.objects.update(
+            home_total=segment_total("home_score"),
+            away_total=segment_total("away_score"),
+            updated_at=timezone.now(),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Updated totals of {updated} matches."))
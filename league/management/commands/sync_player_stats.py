@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from league.helper import refresh_player_stats, segment_player_ids
+from league.models import PlayerSeasonStats, Season
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized player statistics from the segment lineups."
+
+    def handle(self, *args, **options):
+        for season in Season.objects.all():
+            player_ids = segment_player_ids(match__match_day__season=season)
+            # Players taken out of every lineup have no statistics left
+            removed, _ = (
+                PlayerSeasonStats.objects.filter(season=season)
+                .exclude(player_id__in=player_ids)
+                .delete()
+            )
+            refresh_player_stats(player_ids, [season.pk])
+            self.stdout.write(
+                f"Rebuilt statistics of {len(player_ids)} players in {season}, "
+                f"removed {removed} stale ones."
+            )
+        self.stdout.write(self.style.SUCCESS("Player statistics are up to date."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:14
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_match_totals(apps, schema_editor):
+    Match = apps.get_model("league", "Match")
+    SegmentScore = apps.get_model("league", "SegmentScore")
+
+    def segment_total(field):
+        # A frozen copy of league.models.segment_total as of this migration
+        return Coalesce(
+            models.Subquery(
+                SegmentScore.objects.filter(match=models.OuterRef("pk"))
+                .values("match")
+                .annotate(total=models.Sum(field))
+                .values("total")
+            ),
+            0,
+        )
+
+    Match.objects.update(
+        home_total=segment_total("home_score"),
+        away_total=segment_total("away_score"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0013_leaguetable"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="match",
+            name="away_total",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="match",
+            name="home_total",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_match_totals, migrations.RunPython.noop),
+    ]
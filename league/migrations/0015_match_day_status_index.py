@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0014_match_totals"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="match",
+            index=models.Index(
+                fields=["match_day", "status"], name="league_matc_match_d_c1a65e_idx"
+            ),
+        ),
+    ]
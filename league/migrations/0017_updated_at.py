@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0016_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="leaguetable",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="match",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="matchday",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="seasonteam",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="leaguetable",
+            index=models.Index(
+                fields=["match_day", "updated_at"],
+                name="league_leag_match_d_42f349_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="match",
+            index=models.Index(
+                fields=["match_day", "updated_at"],
+                name="league_matc_match_d_5ce534_idx",
+            ),
+        ),
+    ]
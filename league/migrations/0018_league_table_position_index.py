@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0017_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="leaguetable",
+            index=models.Index(
+                fields=["match_day", "position"], name="league_leag_match_d_9a4855_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:35
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0018_league_table_position_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerSeasonStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("singles_played", models.IntegerField(default=0)),
+                ("singles_won", models.IntegerField(default=0)),
+                ("singles_lost", models.IntegerField(default=0)),
+                ("doubles_played", models.IntegerField(default=0)),
+                ("doubles_won", models.IntegerField(default=0)),
+                ("doubles_lost", models.IntegerField(default=0)),
+                ("points_for", models.IntegerField(default=0)),
+                ("points_against", models.IntegerField(default=0)),
+                (
+                    "segments_played",
+                    models.GeneratedField(
+                        db_persist=True,
+                        expression=django.db.models.expressions.CombinedExpression(
+                            models.F("singles_played"), "+", models.F("doubles_played")
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                ),
+                (
+                    "segments_won",
+                    models.GeneratedField(
+                        db_persist=True,
+                        expression=django.db.models.expressions.CombinedExpression(
+                            models.F("singles_won"), "+", models.F("doubles_won")
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                ),
+                (
+                    "point_difference",
+                    models.GeneratedField(
+                        db_persist=True,
+                        expression=django.db.models.expressions.CombinedExpression(
+                            models.F("points_for"), "-", models.F("points_against")
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "player",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="season_stats",
+                        to="league.player",
+                    ),
+                ),
+                (
+                    "season",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="player_stats",
+                        to="league.season",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Player season stats",
+                "ordering": ["-segments_won", "-point_difference", "-points_for"],
+                "unique_together": {("player", "season")},
+            },
+        ),
+    ]
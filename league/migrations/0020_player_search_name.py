@@ -0,0 +1,50 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+def search_key(value):
+    # A frozen copy of league.models.search_key as of this migration
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def fill_search_names(apps, schema_editor):
+    Player = apps.get_model("league", "Player")
+    players = list(Player.objects.all())
+    for player in players:
+        player.search_name = search_key(f"{player.first_name} {player.last_name}")
+        player.search_name_reversed = search_key(
+            f"{player.last_name} {player.first_name}"
+        )
+    Player.objects.bulk_update(
+        players, ["search_name", "search_name_reversed"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0019_player_season_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="search_name",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=101
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="search_name_reversed",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=101
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0020_player_search_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="locked_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("league", "0021_job_locked_until"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="player",
+            index=models.Index(
+                fields=["last_name", "first_name", "id"],
+                name="league_play_last_na_606d63_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="team",
+            index=models.Index(
+                fields=["name", "id"], name="league_team_name_e30124_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,15 @@
+import unicodedata
+
 from django.core.exceptions import ValidationError
-from datetime import timedelta
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.expressions import F
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .planner import plan_fixtures
 
 
 class League(models.Model):
@@ -22,6 +28,7 @@ class Venue(models.Model):
     name = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -36,106 +43,69 @@ class Season(models.Model):
     def __str__(self):
         return f"{self.league} {self.year}/{self.year + 1}"
 
-    def generate_matches(self, start_date, interval_days):
-        teams = list(self.teams.all())
-        num_teams = len(teams)
-
-        if num_teams < 2:
-            return f"Season {self} has insufficient teams."
-
-        # Add a ghost team if the number of teams is odd (bye round)
-        ghost_team = None
-        if num_teams % 2 != 0:
-            ghost_team = Team(name="BYE")
-            teams.append(ghost_team)
-            num_teams += 1
-
-        # Fix the first team and rotate the remaining teams
-        fixed_team = teams[0]
-        rotating_teams = teams[1:]
-
-        round_number = 1
-        match_day_date = start_date
-
-        # First round-robin: alternate home/away for each round
-        for round_idx in range(num_teams - 1):  # We need n-1 rounds
-            match_pairs = []
-
-            # Pair fixed team with the first team in rotating list
-            if round_idx % 2 == 0:
-                match_pairs.append((fixed_team, rotating_teams[0]))
-            else:
-                match_pairs.append((rotating_teams[0], fixed_team))
-
-            # Pair remaining teams
-            for i in range(1, len(rotating_teams) // 2 + 1):
-                home_team = rotating_teams[i]
-                away_team = rotating_teams[-i]
-
-                if round_idx % 2 == 0:
-                    match_pairs.append((home_team, away_team))
-                else:
-                    match_pairs.append((away_team, home_team))
-
-            # Create the match day and matches for this round
-            self._create_match_day_and_matches(
-                match_pairs, match_day_date, round_number
-            )
-
-            # Rotate the teams for the next round (excluding the fixed team)
-            rotating_teams = [rotating_teams[-1]] + rotating_teams[:-1]
-
-            round_number += 1
-            match_day_date += timedelta(days=interval_days)
-
-        # Second round-robin: swap home/away roles
-        match_day_date += timedelta(days=interval_days)
-        for round_idx in range(num_teams - 1):
-            match_pairs = []
-
-            # Pair fixed team with the first team in rotating list
-            if round_idx % 2 == 0:
-                match_pairs.append((rotating_teams[0], fixed_team))
-            else:
-                match_pairs.append((fixed_team, rotating_teams[0]))
-
-            # Pair remaining teams, with home/away swapped
-            for i in range(1, len(rotating_teams) // 2 + 1):
-                home_team = rotating_teams[-i]
-                away_team = rotating_teams[i]
-
-                if round_idx % 2 == 0:
-                    match_pairs.append((home_team, away_team))
-                else:
-                    match_pairs.append((away_team, home_team))
+    def plan_matches(self, start_date, interval_days, legs=2):
+        """
+        Return the fixture plan of the season without writing anything.
+        """
+        return plan_fixtures(list(self.teams.all()), start_date, interval_days, legs)
 
-            # Create matches for this round
-            self._create_match_day_and_matches(
-                match_pairs, match_day_date, round_number
-            )
+    def generate_matches(self, start_date, interval_days, legs=2):
+        plan = self.plan_matches(start_date, interval_days, legs)
 
-            # Rotate the teams for the next round (excluding the fixed team)
-            rotating_teams = [rotating_teams[-1]] + rotating_teams[:-1]
+        if not plan:
+            return f"Season {self} has insufficient teams."
 
-            round_number += 1
-            match_day_date += timedelta(days=interval_days)
+        self._create_match_days_and_matches(plan)
 
         return f"Matches generated for {self}."
 
-    def _create_match_day_and_matches(self, match_pairs, match_day_date, round_number):
-        match_day, _ = MatchDay.objects.get_or_create(
-            season=self, round_number=round_number, date=match_day_date
+    @transaction.atomic
+    def _create_match_days_and_matches(self, plan):
+        """
+        Write a fixture plan with a fixed number of bulk inserts.
+
+        Match days that already exist for a round are reused. Segments are
+        created here because bulk_create does not send post_save signals.
+        """
+        MatchDay.objects.bulk_create(
+            [
+                MatchDay(
+                    season=self,
+                    round_number=planned_round.round_number,
+                    date=planned_round.date,
+                )
+                for planned_round in plan
+            ],
+            ignore_conflicts=True,
         )
-        for home_team, away_team in match_pairs:
-            if home_team.name == "BYE" or away_team.name == "BYE":
-                continue  # Skip "BYE" matches
-
-            Match.objects.create(
-                match_day=match_day,
-                home_team=home_team,
-                away_team=away_team,
-                date=match_day_date,
-            )
+        # MySQL does not return primary keys from bulk inserts, so re-read them.
+        match_days = {
+            match_day.round_number: match_day for match_day in self.match_days.all()
+        }
+
+        Match.objects.bulk_create(
+            [
+                Match(
+                    match_day=match_days[planned_round.round_number],
+                    home_team=fixture.home,
+                    away_team=fixture.away,
+                    date=planned_round.date,
+                )
+                for planned_round in plan
+                for fixture in planned_round.fixtures
+            ]
+        )
+        new_matches = Match.objects.filter(
+            match_day__season=self, segments__isnull=True
+        )
+        SegmentScore.objects.bulk_create(
+            [
+                segment
+                for match in new_matches
+                for segment in SegmentScore.build_segments(match)
+            ]
+        )
+        bump_data_version(self.pk)
 
     class Meta:
         unique_together = ("year", "league")
@@ -152,14 +122,27 @@ class Team(models.Model):
         blank=True,
     )
     venue = models.ForeignKey(Venue, on_delete=models.CASCADE, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
+        # Matches the keyset pagination of the team list, ended by the pk
+        indexes = [models.Index(fields=["name", "id"])]
 
-    def get_schedule(self, season):
-        return self.home_matches.filter(
-            match_day__season=season
-        ) | self.away_matches.filter(match_day__season=season)
+    def get_schedule(self, *seasons):
+        """
+        Return the matches of the team in the given seasons in playing order,
+        with everything a schedule renders selected in the same query.
+        """
+        return (
+            Match.objects.filter(
+                models.Q(home_team=self) | models.Q(away_team=self),
+                match_day__season__in=seasons,
+            )
+            .with_scores()
+            .select_related("match_day__season__league")
+            .order_by("date", "match_day__round_number", "pk")
+        )
 
     def get_absolute_url(self):
         return reverse("team_detail", args=[str(self.pk)])
@@ -168,6 +151,34 @@ class Team(models.Model):
         return self.name
 
 
+def search_key(value):
+    """
+    Fold a name for searching: accents are dropped, case is folded and
+    whitespace collapsed, so "  Éva   Müller" becomes "eva muller".
+    """
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+class PlayerQuerySet(models.QuerySet):
+    def search(self, value):
+        """
+        Filter the players whose "first last" or "last first" name starts with
+        the folded value. Both keys are indexed, so a search is two index
+        range scans however many players there are.
+        """
+        key = search_key(value)
+        if not key:
+            return self
+        # The keys are folded already; unlike LIKE BINARY, the plain LIKE of
+        # istartswith can use the index on MySQL.
+        return self.filter(
+            models.Q(search_name__istartswith=key)
+            | models.Q(search_name_reversed__istartswith=key)
+        )
+
+
 class Player(models.Model):
     user = models.OneToOneField(
         User,
@@ -178,10 +189,36 @@ class Player(models.Model):
     )
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
+    search_name = models.CharField(max_length=101, editable=False, db_index=True)
+    search_name_reversed = models.CharField(
+        max_length=101, editable=False, db_index=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PlayerQuerySet.as_manager()
+
+    class Meta:
+        # Matches the keyset pagination of the player list, ended by the pk
+        indexes = [models.Index(fields=["last_name", "first_name", "id"])]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        self.search_name = search_key(f"{self.first_name} {self.last_name}")
+        self.search_name_reversed = search_key(f"{self.last_name} {self.first_name}")
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"first_name", "last_name"} & set(
+            update_fields
+        ):
+            kwargs["update_fields"] = {
+                *update_fields,
+                "search_name",
+                "search_name_reversed",
+                "updated_at",
+            }
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("player_detail", args=[str(self.pk)])
 
@@ -200,17 +237,34 @@ class SeasonTeam(models.Model):
     season = models.ForeignKey(Season, on_delete=models.CASCADE)
     team = models.ForeignKey(Team, on_delete=models.CASCADE)
     players = models.ManyToManyField(Player, related_name="teams", blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.team.name} in {self.season}"
 
 
+class MatchDayQuerySet(models.QuerySet):
+    def with_progress(self):
+        """
+        Annotate the number of matches and of finished matches of each day.
+        """
+        return self.annotate(
+            match_count=models.Count("matches"),
+            finished_match_count=models.Count(
+                "matches", filter=models.Q(matches__status=Match.Status.FINISHED)
+            ),
+        )
+
+
 class MatchDay(models.Model):
     season = models.ForeignKey(
         Season, on_delete=models.CASCADE, related_name="match_days"
     )
     round_number = models.IntegerField()
     date = models.DateField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MatchDayQuerySet.as_manager()
 
     def __str__(self):
         return f"Round {self.round_number} ({self.season})"
@@ -221,9 +275,21 @@ class MatchDay(models.Model):
 
     @property
     def completed(self):
-        return all(
-            match.status == Match.Status.FINISHED for match in self.matches.all()
-        )
+        if hasattr(self, "finished_match_count"):
+            return self.finished_match_count == self.match_count
+        return not self.matches.exclude(status=Match.Status.FINISHED).exists()
+
+
+class MatchQuerySet(models.QuerySet):
+    def with_teams(self):
+        return self.select_related("home_team", "away_team")
+
+    def with_scores(self):
+        """
+        Matches ready to be shown with their score line. The totals are stored
+        on the match, so only the teams need to be joined.
+        """
+        return self.with_teams()
 
 
 class Match(models.Model):
@@ -243,39 +309,73 @@ class Match(models.Model):
     )
     date = models.DateField()
     status = models.CharField(max_length=20, choices=Status, default=Status.NOT_STARTED)
+    # Sums of the segment scores, kept up to date by the SegmentScore signals
+    home_total = models.IntegerField(default=0, editable=False)
+    away_total = models.IntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MatchQuerySet.as_manager()
 
     class Meta:
         unique_together = ("match_day", "home_team", "away_team")
         ordering = ["match_day"]
         verbose_name_plural = "Matches"
+        indexes = [
+            models.Index(fields=["match_day", "status"]),
+            models.Index(fields=["match_day", "updated_at"]),
+        ]
 
     @property
     def home_score(self):
-        if hasattr(self, "total_home_score"):
-            return self.total_home_score or 0
-        elif self.status == Match.Status.NOT_STARTED:
+        if self.status == Match.Status.NOT_STARTED:
             return None
-
-        return (
-            self.segments.aggregate(total_home_score=models.Sum("home_score"))[
-                "total_home_score"
-            ]
-            or 0
-        )
+        return self.home_total
 
     @property
     def away_score(self):
-        if hasattr(self, "total_away_score"):
-            return self.total_away_score or 0
-        elif self.status == Match.Status.NOT_STARTED:
+        if self.status == Match.Status.NOT_STARTED:
             return None
+        return self.away_total
 
-        return (
-            self.segments.aggregate(total_away_score=models.Sum("away_score"))[
-                "total_away_score"
+    def result_for(self, team):
+        """
+        Return "W", "D" or "L" for the given team once the match is finished.
+        """
+        if self.status != Match.Status.FINISHED:
+            return None
+        if self.home_team_id == team.pk:
+            goals_for, goals_against = self.home_total, self.away_total
+        else:
+            goals_for, goals_against = self.away_total, self.home_total
+        if goals_for > goals_against:
+            return "W"
+        if goals_for < goals_against:
+            return "L"
+        return "D"
+
+    def save(self, *args, **kwargs):
+        # The totals are only written by update_totals, never from a possibly
+        # stale instance.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in ("home_total", "away_total")
             ]
-            or 0
+        super().save(*args, **kwargs)
+
+    def update_totals(self):
+        """
+        Recompute the denormalized totals from the segments in a single UPDATE,
+        so concurrent segment saves cannot overwrite each other's totals.
+        """
+        Match.objects.filter(pk=self.pk).update(
+            home_total=segment_total("home_score"),
+            away_total=segment_total("away_score"),
+            updated_at=timezone.now(),
         )
+        self.refresh_from_db(fields=["home_total", "away_total"])
 
     def __str__(self):
         return f"{self.home_team} vs {self.away_team} on {self.date}"
@@ -288,6 +388,46 @@ class Match(models.Model):
             raise ValidationError("The total score for a team cannot exceed 49 points.")
 
 
+def segment_total(field):
+    """
+    Expression summing a score field over the segments of the outer Match.
+    """
+    return Coalesce(
+        models.Subquery(
+            SegmentScore.objects.filter(match=models.OuterRef("pk"))
+            .values("match")
+            .annotate(total=models.Sum(field))
+            .values("total")
+        ),
+        0,
+    )
+
+
+class SegmentScoreQuerySet(models.QuerySet):
+    def with_running_totals(self):
+        """
+        Annotate the scores of all earlier segments of the same match, computed
+        with a window function in the same query. The window only sees the rows
+        left by the WHERE clause, so filter on whole matches only.
+        """
+        return self.annotate(
+            previous_home_total=self._previous_total("home_score"),
+            previous_away_total=self._previous_total("away_score"),
+        )
+
+    @staticmethod
+    def _previous_total(field):
+        return Coalesce(
+            models.Window(
+                models.Sum(field),
+                partition_by=[F("match")],
+                order_by=F("segment_number").asc(),
+                frame=models.RowRange(start=None, end=-1),
+            ),
+            0,
+        )
+
+
 class SegmentScore(models.Model):
     class SegmentType(models.TextChoices):
         D1 = "D1", "Doubles 1"
@@ -318,31 +458,42 @@ class SegmentScore(models.Model):
         "Player", related_name="away_segments", blank=True
     )
 
+    objects = SegmentScoreQuerySet.as_manager()
+
     class Meta:
         unique_together = ("match", "segment_number")
 
     def __str__(self):
         return f"{self.match} - Segment {self.segment_type}"
 
-    @property
-    def total_home_score(self):
-        previous_total_home_score = (
+    @classmethod
+    def build_segments(cls, match):
+        """
+        Return the 7 unsaved segments (5 doubles, 2 singles) of a match, in order.
+        """
+        return [
+            cls(match=match, segment_number=index, segment_type=segment_type)
+            for index, segment_type in enumerate(cls.SegmentType, start=1)
+        ]
+
+    def _previous_total(self, field):
+        annotation = f"previous_{field}_total"
+        if hasattr(self, annotation):
+            return getattr(self, annotation)
+        return (
             self.match.segments.filter(
                 segment_number__lt=self.segment_number
-            ).aggregate(total_home_score=models.Sum("home_score"))["total_home_score"]
+            ).aggregate(total=models.Sum(f"{field}_score"))["total"]
             or 0
         )
-        return previous_total_home_score + (self.home_score or 0)
+
+    @property
+    def total_home_score(self):
+        return self._previous_total("home") + (self.home_score or 0)
 
     @property
     def total_away_score(self):
-        previous_total_away_score = (
-            self.match.segments.filter(
-                segment_number__lt=self.segment_number
-            ).aggregate(total_away_score=models.Sum("away_score"))["total_away_score"]
-            or 0
-        )
-        return previous_total_away_score + (self.away_score or 0)
+        return self._previous_total("away") + (self.away_score or 0)
 
     def clean(self) -> None:
         max_score = self.segment_number * self.MAX_SCORE
@@ -361,7 +512,7 @@ class LeagueTableManager(models.Manager):
         """
         previous_match_day = (
             MatchDay.objects.filter(
-                season=current_match_day.season,
+                season_id=current_match_day.season_id,
                 round_number__lt=current_match_day.round_number,
             )
             .order_by("-round_number")
@@ -371,6 +522,23 @@ class LeagueTableManager(models.Manager):
             return self.filter(match_day=previous_match_day)
         return self.none()
 
+    def current_standings(self, season):
+        """
+        Retrieve the standings of the latest completed match day of a season,
+        ordered by position. `season` can be a Season, its pk or a queryset
+        returning the pk of one season, which keeps the lookup to one query.
+        """
+        # A snapshot is only built once every match of the match day is finished
+        latest_match_day = (
+            MatchDay.objects.filter(season=season)
+            .filter(models.Exists(self.filter(match_day=models.OuterRef("pk"))))
+            .order_by("-round_number")
+            .values("pk")[:1]
+        )
+        return self.filter(match_day=models.Subquery(latest_match_day)).order_by(
+            "position"
+        )
+
 
 class LeagueTable(models.Model):
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="standings")
@@ -395,12 +563,99 @@ class LeagueTable(models.Model):
     )
 
     position = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = LeagueTableManager()
 
     class Meta:
         unique_together = ("team", "match_day")
         ordering = ["-points", "-goal_difference", "-goals_for"]
+        indexes = [
+            models.Index(fields=["match_day", "updated_at"]),
+            models.Index(fields=["match_day", "position"]),
+        ]
 
     def __str__(self):
         return f"{self.team} - {self.points} points in {self.match_day}"
+
+
+class PlayerSeasonStats(models.Model):
+    """
+    Materialized segment statistics of a player in a season, kept up to date
+    by the signals whenever a segment is scored or a lineup changes.
+    """
+
+    player = models.ForeignKey(
+        Player, on_delete=models.CASCADE, related_name="season_stats"
+    )
+    season = models.ForeignKey(
+        Season, on_delete=models.CASCADE, related_name="player_stats"
+    )
+    singles_played = models.IntegerField(default=0)
+    singles_won = models.IntegerField(default=0)
+    singles_lost = models.IntegerField(default=0)
+    doubles_played = models.IntegerField(default=0)
+    doubles_won = models.IntegerField(default=0)
+    doubles_lost = models.IntegerField(default=0)
+    points_for = models.IntegerField(default=0)
+    points_against = models.IntegerField(default=0)
+    segments_played = models.GeneratedField(
+        expression=F("singles_played") + F("doubles_played"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    segments_won = models.GeneratedField(
+        expression=F("singles_won") + F("doubles_won"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    point_difference = models.GeneratedField(
+        expression=F("points_for") - F("points_against"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("player", "season")
+        ordering = ["-segments_won", "-point_difference", "-points_for"]
+        verbose_name_plural = "Player season stats"
+
+    def __str__(self):
+        return f"{self.player} in {self.season}"
+
+
+class Job(models.Model):
+    """
+    A unit of background work stored in the database and run by the
+    ``run_jobs`` management command.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "Pending"
+        RUNNING = "Running"
+        DONE = "Done"
+        FAILED = "Failed"
+
+    task = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20, choices=Status, default=Status.PENDING, db_index=True
+    )
+    # Identifies identical pending jobs, cleared once the job is picked up
+    dedupe_key = models.CharField(max_length=40, unique=True, null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # End of the lease of a running job, after which it is claimed again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["run_after", "pk"]
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
@@ -0,0 +1,213 @@
+"""
+Keyset pagination for django-tables2 tables.
+
+Offset pagination reads and discards every row before the requested page and
+counts the whole result for the page links. A keyset page instead starts right
+after the ordering values of the last row shown (or right before the first one
+when going back), so a deep page costs the same as the first one. Counting can
+be capped or skipped for the same reason.
+"""
+
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+CURSOR_FIELD = "cursor"
+COUNT_LIMIT = 1000
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginator for the rows of a table over a queryset, used through
+    `Table.paginate(paginator_class=KeysetPaginator, cursor=...)`.
+
+    `count` is "exact" for a full COUNT(*), "estimate" for a count capped at
+    COUNT_LIMIT rows, or None to skip counting.
+    """
+
+    def __init__(self, rows, per_page, cursor=None, count="estimate", **kwargs):
+        self.rows = rows
+        self.per_page = int(per_page)
+        self.cursor = cursor
+        self.count_mode = count
+
+    @cached_property
+    def queryset(self):
+        # The queryset of the table, ordered by the table if it was sorted
+        return self.rows.data.data
+
+    @cached_property
+    def ordering(self):
+        """
+        The (field, descending) pairs the pages are ordered by, ending with
+        the primary key so that the order is total.
+        """
+        query = self.queryset.query
+        fields = list(query.order_by) or list(query.get_meta().ordering)
+        ordering = []
+        for field in fields:
+            if not isinstance(field, str):
+                raise ImproperlyConfigured(
+                    "Keyset pagination only supports ordering by field names."
+                )
+            ordering.append((field.lstrip("-"), field.startswith("-")))
+        pk_names = {"pk", query.get_meta().pk.name}
+        if not pk_names & {name for name, _ in ordering}:
+            ordering.append(("pk", False))
+        return ordering
+
+    @cached_property
+    def count(self):
+        if self.count_mode == "exact":
+            return self.queryset.count()
+        if self.count_mode == "estimate":
+            return self.queryset.order_by()[: COUNT_LIMIT + 1].count()
+        return None
+
+    @property
+    def count_is_capped(self):
+        return self.count is not None and self.count > COUNT_LIMIT
+
+    def page(self, number=1):
+        """
+        Return the page at the cursor. The page number is ignored.
+        """
+        backwards, values = self._decode(self.cursor)
+        queryset = self.queryset.annotate(
+            **{
+                f"keyset_{index}": F(name)
+                for index, (name, _) in enumerate(self.ordering)
+            }
+        ).order_by(*self._order_by(backwards))
+        if values is not None:
+            queryset = queryset.filter(self._beyond(values, backwards))
+
+        records = list(queryset[: self.per_page + 1])
+        has_more = len(records) > self.per_page
+        records = records[: self.per_page]
+        if backwards:
+            records.reverse()
+
+        has_next = bool(records) and (has_more or backwards)
+        has_previous = bool(records) and (has_more if backwards else values is not None)
+        return KeysetPage(
+            type(self.rows)(data=records, table=self.rows.table),
+            self,
+            self._encode(records[-1], backwards=False) if has_next else None,
+            self._encode(records[0], backwards=True) if has_previous else None,
+        )
+
+    def _order_by(self, backwards):
+        # NULLs sort first ascending and last descending, which is the default
+        # of MySQL and keeps the reversed order the exact mirror image.
+        return [
+            (
+                F(name).desc(nulls_last=True)
+                if descending != backwards
+                else F(name).asc(nulls_first=True)
+            )
+            for name, descending in self.ordering
+        ]
+
+    def _beyond(self, values, backwards):
+        """
+        Condition for the rows that come after the cursor values in the
+        direction of the page.
+        """
+        conditions = []
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            if descending != backwards:
+                if value is not None:
+                    conditions.append(
+                        equal
+                        & (Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True}))
+                    )
+            elif value is None:
+                conditions.append(equal & Q(**{f"{name}__isnull": False}))
+            else:
+                conditions.append(equal & Q(**{f"{name}__gt": value}))
+            equal &= (
+                Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+            )
+        return reduce(or_, conditions, Q(pk__in=[]))
+
+    def _signature(self):
+        return [
+            f"{'-' if descending else ''}{name}" for name, descending in self.ordering
+        ]
+
+    def _encode(self, record, backwards):
+        values = [
+            getattr(record, f"keyset_{index}") for index in range(len(self.ordering))
+        ]
+        payload = {"o": self._signature(), "v": values, "b": backwards}
+        data = json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _decode(self, cursor):
+        """
+        Return the direction and values of a cursor, or no values for the first
+        page. Invalid cursors and cursors of another ordering, left in the URL
+        when the table is sorted again, start from the first page.
+        """
+        if not cursor:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return False, None
+        if not isinstance(payload, dict) or payload.get("o") != self._signature():
+            return False, None
+        values = payload.get("v")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            return False, None
+        return bool(payload.get("b")), values
+
+
+class KeysetPaginationMixin:
+    """
+    Paginate the table of a SingleTableMixin view by cursor instead of by
+    page number. `keyset_count` is passed on as the `count` of the paginator.
+    """
+
+    keyset_per_page = 10
+    keyset_count = "estimate"
+
+    def get_table_pagination(self, table):
+        return {
+            "paginator_class": KeysetPaginator,
+            "per_page": self.keyset_per_page,
+            "count": self.keyset_count,
+            "cursor": self.request.GET.get(CURSOR_FIELD),
+        }
@@ -0,0 +1,107 @@
+"""
+In-memory fixture planning.
+
+Nothing in this module touches the database: teams can be model instances or
+any other hashable objects, which makes it cheap to compare candidate
+schedules before they are written by Season.generate_matches.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Hashable, Sequence
+
+
+@dataclass(frozen=True)
+class Fixture:
+    home: Hashable
+    away: Hashable
+
+
+@dataclass(frozen=True)
+class PlannedRound:
+    round_number: int
+    date: date
+    fixtures: tuple[Fixture, ...]
+
+
+@dataclass(frozen=True)
+class FixturePlan:
+    rounds: tuple[PlannedRound, ...] = ()
+
+    def __iter__(self):
+        return iter(self.rounds)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    @property
+    def fixtures(self):
+        return [
+            fixture
+            for planned_round in self.rounds
+            for fixture in planned_round.fixtures
+        ]
+
+    @property
+    def match_count(self):
+        return sum(len(planned_round.fixtures) for planned_round in self.rounds)
+
+
+def plan_fixtures(
+    teams: Sequence[Hashable], start_date: date, interval_days: int, legs: int = 2
+) -> FixturePlan:
+    """
+    Plan a round-robin with the circle method, played `legs` times.
+
+    Home and away alternate from one round to the next and are swapped in every
+    other leg. A free week separates two legs. With an odd number of teams one
+    team sits out each round.
+    """
+    teams = list(teams)
+    if len(teams) < 2:
+        return FixturePlan()
+
+    # A None slot marks the team that has a bye in a round
+    if len(teams) % 2 != 0:
+        teams.append(None)
+
+    rounds = []
+    round_number = 1
+    match_day_date = start_date
+
+    for leg in range(legs):
+        if leg > 0:
+            match_day_date += timedelta(days=interval_days)
+
+        for pairs in _circle_rounds(teams):
+            fixtures = tuple(
+                Fixture(away, home) if leg % 2 else Fixture(home, away)
+                for home, away in pairs
+                if home is not None and away is not None
+            )
+            rounds.append(PlannedRound(round_number, match_day_date, fixtures))
+
+            round_number += 1
+            match_day_date += timedelta(days=interval_days)
+
+    return FixturePlan(tuple(rounds))
+
+
+def _circle_rounds(teams):
+    """
+    Yield the (home, away) pairs of each round of a single round-robin.
+    """
+    # Fix the first team and rotate the remaining teams
+    fixed_team = teams[0]
+    rotating_teams = teams[1:]
+
+    for round_idx in range(len(teams) - 1):
+        pairs = [(fixed_team, rotating_teams[0])]
+        for i in range(1, len(rotating_teams) // 2 + 1):
+            pairs.append((rotating_teams[i], rotating_teams[-i]))
+
+        if round_idx % 2 != 0:
+            pairs = [(away, home) for home, away in pairs]
+        yield pairs
+
+        rotating_teams = [rotating_teams[-1]] + rotating_teams[:-1]
@@ -0,0 +1,43 @@
+"""
+Read model of a match scorecard.
+
+Everything the match page shows is loaded in a fixed number of queries: the
+match with its teams and venue, the segments with their running totals, and
+the home and away players of every segment.
+"""
+
+from dataclasses import dataclass
+
+from .models import Match, SegmentScore
+
+
+@dataclass(frozen=True)
+class Scorecard:
+    match: Match
+    segments: tuple[SegmentScore, ...]
+
+    @classmethod
+    def load(cls, match_id):
+        """
+        Load the scorecard of a match, raising Match.DoesNotExist if there is
+        no such match.
+        """
+        match = (
+            Match.objects.with_scores()
+            .select_related("home_team__venue")
+            .get(pk=match_id)
+        )
+        return cls.for_match(match)
+
+    @classmethod
+    def for_match(cls, match):
+        """
+        Build the scorecard of an already loaded match.
+        """
+        segments = (
+            SegmentScore.objects.filter(match=match)
+            .with_running_totals()
+            .prefetch_related("home_players", "away_players")
+            .order_by("segment_number")
+        )
+        return cls(match, tuple(segments))
@@ -1,7 +1,132 @@
-from django.db.models.signals import post_save
-from .helper import update_standings_for_new_match_day
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.utils import timezone
+from .cache import bump_data_version, bump_shared_data_version
+from .helper import (
+    refresh_player_stats,
+    repair_standings_for_matches,
+    segment_player_ids,
+)
+from .jobs import enqueue
+from .live import publish_match, publish_segment
 from django.dispatch import receiver
-from .models import Match, SegmentScore
+from .models import (
+    LeagueTable,
+    Match,
+    MatchDay,
+    Player,
+    Season,
+    SeasonTeam,
+    SegmentScore,
+    Team,
+    Venue,
+    segment_total,
+)
+
+# Ids of the matches whose segment side effects are deferred, if any
+_deferred_match_ids = ContextVar("deferred_match_ids", default=None)
+# Ids of the players taken out of a lineup while the side effects are deferred
+_deferred_player_ids = ContextVar("deferred_player_ids", default=None)
+
+
+@contextmanager
+def deferred_match_updates():
+    """
+    Defer the side effects of the segment saves in the block (match totals,
+    match completion, standings) and run them once per match after the
+    transaction commits.
+    """
+    if _deferred_match_ids.get() is not None:
+        yield  # Already deferred by an enclosing block
+        return
+
+    match_ids, player_ids = set(), set()
+    with transaction.atomic():
+        token = _deferred_match_ids.set(match_ids)
+        player_token = _deferred_player_ids.set(player_ids)
+        try:
+            yield
+        finally:
+            # Reset before the commit callbacks run, so that their own saves
+            # have their side effects instead of being deferred again
+            _deferred_player_ids.reset(player_token)
+            _deferred_match_ids.reset(token)
+        transaction.on_commit(
+            partial(conclude_matches, frozenset(match_ids), frozenset(player_ids))
+        )
+
+
+def defer_match_update(segment):
+    """
+    Record the match of a segment if its side effects are deferred.
+    """
+    match_ids = _deferred_match_ids.get()
+    if match_ids is None:
+        return False
+    match_ids.add(segment.match_id)
+    return True
+
+
+def defer_player_stats_update(segment, player_ids):
+    """
+    Record the players of a lineup change if the segment side effects are
+    deferred. The players still lined up are found again when concluding.
+    """
+    deferred_player_ids = _deferred_player_ids.get()
+    if deferred_player_ids is None:
+        return False
+    defer_match_update(segment)
+    deferred_player_ids.update(player_ids)
+    return True
+
+
+def conclude_matches(match_ids, player_ids=()):
+    """
+    Update the totals of the given matches, then finish the ones that have
+    been fully scored and repair the standings of the finished ones. Finally
+    refresh the statistics of the players of the matches and of `player_ids`.
+    """
+    Match.objects.filter(pk__in=match_ids).update(
+        home_total=segment_total("home_score"),
+        away_total=segment_total("away_score"),
+        updated_at=timezone.now(),
+    )
+    finished_matches = []
+    season_ids = set()
+    for match in Match.objects.filter(pk__in=match_ids).select_related("match_day"):
+        season_ids.add(match.match_day.season_id)
+        bump_data_version(match.match_day.season_id)
+        publish_match(match)
+        if match.status == Match.Status.FINISHED:
+            finished_matches.append(match)
+        else:
+            finish_match_if_scored(match)
+    if finished_matches:
+        repair_standings_for_matches(finished_matches)
+    refresh_player_stats(
+        segment_player_ids(match__in=match_ids) | set(player_ids), season_ids
+    )
+
+
+def finish_match_if_scored(match):
+    """
+    Finish an in-progress match once all segments have been scored.
+    """
+    if match.status != Match.Status.IN_PROGRESS:
+        return
+    finished_match_score_condition = (
+        match.home_score == 49
+        or match.away_score == 49
+        or (match.home_score == 48 and match.away_score == 48)
+    )
+    if finished_match_score_condition and match.segments.count() == 7:
+        match.status = Match.Status.FINISHED
+        match.save()
 
 
 @receiver(post_save, sender=Match)
@@ -10,23 +135,7 @@ def create_segments_for_match(sender, instance, created, **kwargs):
     Automatically create 7 segments (5 doubles, 2 singles) when a match is created.
     """
     if created:
-        # Define the 7 segments in order
-        segment_types = [
-            SegmentScore.SegmentType.D1,  # Doubles 1
-            SegmentScore.SegmentType.D2,  # Doubles 2
-            SegmentScore.SegmentType.S1,  # Singles 1
-            SegmentScore.SegmentType.D3,  # Doubles 3
-            SegmentScore.SegmentType.S2,  # Singles 2
-            SegmentScore.SegmentType.D4,  # Doubles 4
-            SegmentScore.SegmentType.D5,  # Doubles 5
-        ]
-
-        for index, segment_type in enumerate(segment_types, start=1):
-            SegmentScore.objects.create(
-                match=instance,
-                segment_number=index,  # Segment number 1 through 7
-                segment_type=segment_type,
-            )
+        SegmentScore.objects.bulk_create(SegmentScore.build_segments(instance))
 
 
 @receiver(post_save, sender=Match)
@@ -34,10 +143,28 @@ def update_standings_on_match_update(sender, instance, **kwargs):
     """
     Signal handler to update standings only when all matches for a match day are finished.
     """
+    if instance.status != Match.Status.FINISHED:
+        return  # The match day cannot be completed
+
     match_day = instance.match_day
 
     if match_day.completed:
-        update_standings_for_new_match_day(match_day)
+        if match_day.team_standings.exists():
+            repair_standings_for_matches([instance])
+        else:
+            # Rebuilding the table is left to the job queue worker
+            enqueue("update_standings", match_day_id=match_day.pk)
+
+
+@receiver(post_save, sender=SegmentScore)
+@receiver(post_delete, sender=SegmentScore)
+def update_match_totals_on_score_change(sender, instance, **kwargs):
+    """
+    Signal handler to keep the denormalized match totals in sync with the segments.
+    """
+    if defer_match_update(instance):
+        return
+    instance.match.update_totals()
 
 
 @receiver(post_save, sender=SegmentScore)
@@ -45,14 +172,209 @@ def finish_match_on_finished_score(sender, instance, **kwargs):
     """
     Signal handler to finish the match when all segments have been scored.
     """
-    match = instance.match
-    if match.status in (Match.Status.FINISHED, Match.Status.NOT_STARTED):
+    if defer_match_update(instance):
         return
-    finished_match_score_condition = (
-        match.home_score == 49
-        or match.away_score == 49
-        or (match.home_score == 48 and match.away_score == 48)
+    finish_match_if_scored(instance.match)
+
+
+@receiver(post_save, sender=SegmentScore)
+def repair_standings_on_corrected_score(sender, instance, **kwargs):
+    """
+    Signal handler to carry a corrected score of a finished match through the standings.
+    """
+    if defer_match_update(instance):
+        return
+    if instance.match.status == Match.Status.FINISHED:
+        repair_standings_for_matches([instance.match])
+
+
+@receiver(post_save, sender=SegmentScore)
+def update_player_stats_on_score_change(sender, instance, **kwargs):
+    """
+    Signal handler to refresh the statistics of the players of a segment when
+    its score changes.
+    """
+    if defer_match_update(instance):
+        return
+    refresh_player_stats(
+        segment_player_ids(pk=instance.pk), [instance.match.match_day.season_id]
     )
-    if match.segments.count() == 7 and finished_match_score_condition:
-        match.status = Match.Status.FINISHED
-        match.save()
+
+
+@receiver(post_delete, sender=Match)
+def touch_match_day_on_match_delete(sender, instance, **kwargs):
+    """
+    Signal handler to mark the match day of a deleted match as modified, as
+    the latest update of its remaining matches cannot tell.
+    """
+    MatchDay.objects.filter(pk=instance.match_day_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=SegmentScore)
+def publish_score_change(sender, instance, **kwargs):
+    """
+    Signal handler to push a segment score, and the match totals updated by
+    the handlers above, to the live scoreboards.
+    """
+    publish_segment(instance)
+    if not defer_match_update(instance):
+        publish_match(instance.match)
+
+
+@receiver(post_save, sender=Match)
+def publish_match_change(sender, instance, **kwargs):
+    """
+    Signal handler to push the status and totals of a match to the live
+    scoreboards.
+    """
+    publish_match(instance)
+
+
+@receiver(pre_delete, sender=SegmentScore)
+def remember_lineup_on_segment_delete(sender, instance, **kwargs):
+    """
+    Signal handler to remember the players of a segment before its lineup is
+    deleted with it.
+    """
+    instance._lineup_player_ids = segment_player_ids(pk=instance.pk)
+    instance._season_id = instance.match.match_day.season_id
+
+
+@receiver(post_delete, sender=SegmentScore)
+def update_player_stats_on_segment_delete(sender, instance, **kwargs):
+    """
+    Signal handler to take a deleted segment out of the player statistics.
+    """
+    if defer_player_stats_update(instance, instance._lineup_player_ids):
+        return
+    refresh_player_stats(instance._lineup_player_ids, [instance._season_id])
+
+
+@receiver(m2m_changed, sender=SegmentScore.home_players.through)
+@receiver(m2m_changed, sender=SegmentScore.away_players.through)
+def update_player_stats_on_lineup_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Signal handler to refresh the statistics of the players added to or
+    removed from the lineup of a scored segment.
+    """
+    if reverse:  # The segments of a player were changed
+        if action == "pre_clear":
+            instance._stats_season_ids = set(
+                instance.season_stats.values_list("season_id", flat=True)
+            )
+        elif action == "post_clear":
+            refresh_player_stats([instance.pk], instance._stats_season_ids)
+        elif action in ("post_add", "post_remove"):
+            refresh_player_stats(
+                [instance.pk],
+                SegmentScore.objects.filter(pk__in=pk_set).values_list(
+                    "match__match_day__season_id", flat=True
+                ),
+            )
+        return
+
+    if instance.home_score is None or instance.away_score is None:
+        return  # Unscored segments are not counted
+    if action == "pre_clear":
+        instance._cleared_player_ids = segment_player_ids(pk=instance.pk)
+        return
+    if action == "post_clear":
+        player_ids = instance._cleared_player_ids
+    elif action in ("post_add", "post_remove"):
+        player_ids = pk_set
+    else:
+        return
+    if defer_player_stats_update(instance, player_ids):
+        return
+    refresh_player_stats(player_ids, [instance.match.match_day.season_id])
+
+
+@receiver(m2m_changed, sender=SegmentScore.home_players.through)
+@receiver(m2m_changed, sender=SegmentScore.away_players.through)
+def touch_match_on_lineup_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Signal handler to mark the match of a changed lineup as modified, so that
+    its cached and conditional pages show the new lineup.
+    """
+    if reverse:  # The segments of a player were changed
+        if action == "pre_clear":
+            instance._lineup_match_ids = set(
+                SegmentScore.objects.filter(
+                    Q(home_players=instance) | Q(away_players=instance)
+                ).values_list("match_id", flat=True)
+            )
+            return
+        if action == "post_clear":
+            matches = Match.objects.filter(pk__in=instance._lineup_match_ids)
+        elif action in ("post_add", "post_remove"):
+            matches = Match.objects.filter(segments__pk__in=pk_set)
+        else:
+            return
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if defer_match_update(instance):
+            return  # Touched once per match when the updates are concluded
+        matches = Match.objects.filter(pk=instance.match_id)
+    else:
+        return
+
+    season_ids = set(matches.values_list("match_day__season_id", flat=True))
+    matches.update(updated_at=timezone.now())
+    for season_id in season_ids:
+        bump_data_version(season_id)
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+@receiver(post_save, sender=MatchDay)
+@receiver(post_delete, sender=MatchDay)
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+@receiver(post_save, sender=SegmentScore)
+@receiver(post_delete, sender=SegmentScore)
+@receiver(post_save, sender=LeagueTable)
+@receiver(post_delete, sender=LeagueTable)
+def bump_data_version_on_change(sender, instance, **kwargs):
+    """
+    Signal handler to invalidate the cached pages of the season that changed.
+    """
+    if sender is SegmentScore:
+        if defer_match_update(instance):
+            return  # Bumped once per match when the updates are concluded
+        season_id = instance.match.match_day.season_id
+    elif sender is Season:
+        season_id = instance.pk
+    elif sender is MatchDay:
+        season_id = instance.season_id
+    else:
+        season_id = instance.match_day.season_id
+    bump_data_version(season_id)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def bump_shared_data_version_on_change(sender, instance, **kwargs):
+    """
+    Signal handler to invalidate the cached pages showing a team, venue or
+    player that changed, which can be pages of any season.
+    """
+    bump_shared_data_version()
+
+
+@receiver(m2m_changed, sender=SeasonTeam.players.through)
+def touch_season_team_on_squad_change(sender, instance, action, pk_set, **kwargs):
+    """
+    Signal handler to mark a squad as modified when players join or leave it.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, SeasonTeam):
+        season_teams = SeasonTeam.objects.filter(pk=instance.pk)
+    else:  # Changed from the player side
+        season_teams = SeasonTeam.objects.filter(pk__in=pk_set or ())
+    season_teams.update(updated_at=timezone.now())
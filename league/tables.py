@@ -1,7 +1,8 @@
 import django_tables2 as tables
 from django.utils.translation import gettext_lazy as _
-from django.utils.html import format_html, escape
-from .models import Player, Team, SegmentScore, LeagueTable
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+from .models import Player, PlayerSeasonStats, Team, SegmentScore, LeagueTable
 
 
 class PlayerTable(tables.Table):
@@ -16,7 +17,7 @@ class PlayerTable(tables.Table):
 
     class Meta:
         model = Player
-        template_name = "django_tables2/material_tailwind_htmx.html"
+        template_name = "django_tables2/material_tailwind_htmx_keyset.html"
         fields = ("first_name", "last_name")
 
 
@@ -30,16 +31,30 @@ class TeamTable(tables.Table):
 
     class Meta:
         model = Team
-        template_name = "django_tables2/material_tailwind_htmx.html"
+        template_name = "django_tables2/material_tailwind_htmx_keyset.html"
         fields = ("name", "venue")
 
 
 class SegmentTable(tables.Table):
     segment_type = tables.Column(verbose_name=_("Segment Type"), orderable=False)
     home_players = tables.Column(verbose_name=_("Home Players"), orderable=False)
-    home_score = tables.Column(verbose_name=_("Home Score"), orderable=False)
-    away_score = tables.Column(verbose_name=_("Away Score"), orderable=False)
+    home_score = tables.Column(
+        verbose_name=_("Home Score"),
+        orderable=False,
+        attrs={"td": {"data-field": "home_score"}},
+    )
+    away_score = tables.Column(
+        verbose_name=_("Away Score"),
+        orderable=False,
+        attrs={"td": {"data-field": "away_score"}},
+    )
     away_players = tables.Column(verbose_name=_("Away Players"), orderable=False)
+    running_score = tables.Column(
+        verbose_name=_("Running Score"),
+        orderable=False,
+        empty_values=(),
+        attrs={"td": {"data-field": "running_score"}},
+    )
 
     class Meta:
         model = SegmentScore
@@ -50,16 +65,25 @@ class SegmentTable(tables.Table):
             "home_score",
             "away_score",
             "away_players",
+            "running_score",
         )
+        # Lets the live scoreboard find the row of a segment
+        row_attrs = {"data-segment": lambda record: record.segment_number}
+
+    def render_running_score(self, record):
+        if record.home_score is None and record.away_score is None:
+            return "—"
+        return f"{record.total_home_score} - {record.total_away_score}"
 
     def render_home_players(self, record):
-        return format_html(
-            "<br>".join([escape(str(player)) for player in record.home_players.all()])
+        # Players are prefetched by the scorecard
+        return format_html_join(
+            mark_safe("<br>"), "{}", ((player,) for player in record.home_players.all())
         )
 
     def render_away_players(self, record):
-        return format_html(
-            "<br>".join([escape(str(player)) for player in record.away_players.all()])
+        return format_html_join(
+            mark_safe("<br>"), "{}", ((player,) for player in record.away_players.all())
         )
 
 
@@ -68,6 +92,8 @@ class LeagueTableTable(tables.Table):
     team = tables.Column(
         linkify=True,
         attrs={"a": {"class": "hover:text-blue-500 hover:underline"}},
+        # Teams are ordered by name, which also sorts rows loaded in memory
+        order_by=("team__name",),
     )
     played = tables.Column(verbose_name="P")
     wins = tables.Column(verbose_name="W")
@@ -94,3 +120,33 @@ class LeagueTableTable(tables.Table):
 
     def render_goals_for(self, value, record):
         return f"{value}:{record.goals_against}"
+
+
+class PlayerStatsTable(tables.Table):
+    player = tables.Column(
+        linkify=True,
+        attrs={"a": {"class": "hover:text-blue-500 hover:underline"}},
+        order_by=("player__last_name", "player__first_name"),
+        verbose_name=_("Player"),
+    )
+    segments_played = tables.Column(verbose_name=_("Played"))
+    segments_won = tables.Column(verbose_name=_("Won"))
+    singles_won = tables.Column(verbose_name=_("Singles won"))
+    doubles_won = tables.Column(verbose_name=_("Doubles won"))
+    points_for = tables.Column(verbose_name=_("Points for"))
+    points_against = tables.Column(verbose_name=_("Points against"))
+    point_difference = tables.Column(verbose_name=_("Difference"))
+
+    class Meta:
+        model = PlayerSeasonStats
+        template_name = "django_tables2/material_tailwind_htmx.html"
+        fields = (
+            "player",
+            "segments_played",
+            "segments_won",
+            "singles_won",
+            "doubles_won",
+            "points_for",
+            "points_against",
+            "point_difference",
+        )
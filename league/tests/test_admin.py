@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from league.jobs import run_pending_jobs
+from league.models import League, Match, Player, Season, SeasonTeam, Team
+
+
+@pytest.fixture
+def season(db):
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    for name in ["Team 1", "Team 2", "Team 3", "Team 4"]:
+        SeasonTeam.objects.create(season=season, team=Team.objects.create(name=name))
+    return season
+
+
+def generation_data(**extra):
+    start_date = datetime.date(2023, 1, 1)
+    return {
+        "start_date_year": start_date.year,
+        "start_date_month": start_date.month,
+        "start_date_day": start_date.day,
+        "interval_days": 7,
+        "legs": 2,
+        **extra,
+    }
+
+
+def test_generate_matches_preview_does_not_write(admin_client, season):
+    url = reverse("admin:generate_matches", args=[season.pk])
+
+    response = admin_client.post(url, generation_data(preview=""))
+
+    assert response.status_code == 200
+    assert len(response.context["plan"]) == 6
+    assert response.context["plan"].match_count == 12
+    assert b"Team 1 vs" in response.content
+    assert not Match.objects.exists()
+
+
+def test_generate_matches_writes_schedule(admin_client, season):
+    url = reverse("admin:generate_matches", args=[season.pk])
+
+    response = admin_client.post(url, generation_data())
+
+    assert response.status_code == 302
+    assert not Match.objects.exists()  # Queued for the worker
+
+    run_pending_jobs()
+
+    assert Match.objects.filter(match_day__season=season).count() == 12
+
+
+def test_match_change_page_query_count_is_independent_of_rosters(admin_client, season):
+    season.generate_matches(datetime.date(2023, 1, 1), 7, legs=1)
+    match = Match.objects.filter(match_day__season=season).first()
+    url = reverse("admin:league_match_change", args=[match.pk])
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as queries:
+            assert admin_client.get(url).status_code == 200
+        return len(queries)
+
+    count_queries()  # Warm up the per-process caches of the admin
+    query_count = count_queries()
+
+    for team in (match.home_team, match.away_team):
+        players = [
+            Player.objects.create(first_name=team.name, last_name=str(index))
+            for index in range(4)
+        ]
+        SeasonTeam.objects.get(season=season, team=team).players.add(*players)
+        for segment in match.segments.all():
+            segment.home_players.add(*players[:2])
+
+    assert count_queries() == query_count
+
+
+def test_match_add_page_does_not_load_rosters(admin_client, season):
+    with CaptureQueriesContext(connection) as queries:
+        assert admin_client.get(reverse("admin:league_match_add")).status_code == 200
+
+    assert not [query for query in queries if "league_player" in query["sql"]]
@@ -0,0 +1,166 @@
+import datetime
+
+import pytest
+from django.forms import modelformset_factory
+from league.forms import SegmentFormSet, SegmentLineupForm
+from league.models import League, Match, Player, Season, SeasonTeam, SegmentScore, Team
+
+LineupFormSet = modelformset_factory(
+    SegmentScore, form=SegmentLineupForm, formset=SegmentFormSet, extra=0
+)
+
+
+@pytest.fixture
+def match(db):
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    for name in ["Home", "Away"]:
+        season_team = SeasonTeam.objects.create(
+            season=season, team=Team.objects.create(name=name)
+        )
+        season_team.players.set(
+            [
+                Player.objects.create(first_name=name, last_name=str(index))
+                for index in range(4)
+            ]
+        )
+    season.generate_matches(datetime.date(2023, 1, 1), 7, legs=1)
+    return Match.objects.get()
+
+
+def roster(match, side):
+    team = getattr(match, f"{side}_team")
+    return list(SeasonTeam.objects.get(team=team).players.order_by("last_name"))
+
+
+def lineup_data(segments, lineups):
+    """
+    Return the POST data of a lineup formset, `lineups` mapping segment types
+    to the home players picked.
+    """
+    data = {
+        "form-TOTAL_FORMS": len(segments),
+        "form-INITIAL_FORMS": len(segments),
+    }
+    for index, segment in enumerate(segments):
+        data[f"form-{index}-id"] = segment.pk
+        data[f"form-{index}-home_players"] = [
+            player.pk for player in lineups.get(segment.segment_type, [])
+        ]
+    return data
+
+
+def bound_formset(queryset, lineups):
+    return LineupFormSet(
+        lineup_data(list(queryset), lineups), queryset=queryset.with_running_totals()
+    )
+
+
+def form_errors(formset):
+    return {
+        form.instance.segment_type: form.non_field_errors() for form in formset.forms
+    }
+
+
+def test_lineups_are_checked_against_the_other_forms(match):
+    first, second, third, _ = roster(match, "home")
+    formset = bound_formset(
+        match.segments.order_by("segment_number"),
+        {"D1": [first, second], "D2": [first, third]},
+    )
+
+    assert not formset.is_valid()
+    errors = form_errors(formset)
+    assert (
+        errors["D1"]
+        == errors["D2"]
+        == [
+            f"Player {first} cannot participate in multiple segments of the same group (D1, D2)."
+        ]
+    )
+    assert not errors["D3"]
+
+
+def test_moving_a_player_within_a_group_is_valid(match):
+    first, second, third, fourth = roster(match, "home")
+    match.segments.get(segment_type="D1").home_players.set([first, second])
+
+    formset = bound_formset(
+        match.segments.order_by("segment_number"),
+        {"D1": [third, fourth], "D2": [first, second]},
+    )
+
+    assert formset.is_valid(), form_errors(formset)
+
+
+def test_lineups_are_checked_against_saved_segments(match):
+    first, second, third, _ = roster(match, "home")
+    match.segments.get(segment_type="S2").home_players.set([first])
+
+    formset = bound_formset(
+        match.segments.exclude(segment_type="S2").order_by("segment_number"),
+        {"S1": [first], "D3": [second, third]},
+    )
+
+    assert not formset.is_valid()
+    assert form_errors(formset)["S1"] == [
+        f"Player {first} cannot participate in multiple segments of the same group (S1, S2)."
+    ]
+
+
+def test_player_counts(match):
+    first, second, *_ = roster(match, "home")
+
+    formset = bound_formset(
+        match.segments.order_by("segment_number"),
+        {"D1": [first], "S1": [first, second]},
+    )
+
+    assert not formset.is_valid()
+    errors = form_errors(formset)
+    assert errors["D1"] == [
+        "Home team must have exactly 2 players for doubles segment D1."
+    ]
+    assert (
+        "Home team must have exactly 1 player for singles segment S1." in errors["S1"]
+    )
+
+
+def test_players_of_other_teams_cannot_be_picked(match):
+    formset = bound_formset(
+        match.segments.order_by("segment_number"),
+        {"S1": roster(match, "away")[:1]},
+    )
+
+    assert not formset.is_valid()
+    assert formset.forms[2].errors["home_players"]
+
+
+def test_lineups_are_validated_with_a_constant_number_of_queries(
+    match, django_assert_num_queries
+):
+    players = roster(match, "home")
+    for segment in match.segments.all():
+        segment.home_players.set(players[:2])
+    queryset = match.segments.order_by("segment_number")
+    data = lineup_data(
+        list(queryset),
+        {
+            "D1": players[:2],
+            "D2": players[2:],
+            "S1": players[:1],
+            "D3": players[1:3],
+            "D4": players[:2],
+            "D5": players[2:],
+        },
+    )
+
+    # The segments, their two lineups, the rosters and the saved lineups
+    with django_assert_num_queries(5):
+        formset = LineupFormSet(
+            data,
+            queryset=queryset.with_running_totals().prefetch_related(
+                "home_players", "away_players"
+            ),
+        )
+        assert formset.is_valid(), form_errors(formset)
@@ -8,7 +8,12 @@ from league.models import (
     Team,
     Season,
 )
-from league.helper import update_standings_for_new_match_day
+from league.helper import (
+    STAT_FIELDS,
+    build_standings_history,
+    repair_standings_for_matches,
+    update_standings_for_new_match_day,
+)
 from league.signals import update_standings_on_match_update
 from django.db.models.signals import post_save
 
@@ -140,3 +145,201 @@ def test_new_standings_creation(league_setup):
 
     for team in league_setup["teams"]:
         assert LeagueTable.objects.filter(match_day=match_day, team=team).exists()
+
+
+def test_standings_rebuild_replaces_existing_snapshot(league_setup):
+    match_day = league_setup["match_day"]
+
+    update_standings_for_new_match_day(match_day)
+    update_standings_for_new_match_day(match_day)
+
+    assert LeagueTable.objects.filter(match_day=match_day).count() == 4
+    assert (
+        LeagueTable.objects.get(
+            match_day=match_day, team=league_setup["teams"][0]
+        ).played
+        == 1
+    )
+
+
+def test_standings_carry_forward_teams_without_match(league_setup):
+    match_day = league_setup["match_day"]
+    team1, team2, team3, team4 = league_setup["teams"]
+    update_standings_for_new_match_day(match_day)
+
+    next_match_day = MatchDay.objects.create(
+        season=league_setup["season"], round_number=2, date="2023-01-08"
+    )
+    match = Match.objects.create(
+        match_day=next_match_day,
+        home_team=team2,
+        away_team=team1,
+        date=next_match_day.date,
+    )
+    set_segment_score(match, 1, 5, 0)
+    Match.objects.filter(pk=match.pk).update(status=Match.Status.FINISHED)
+
+    update_standings_for_new_match_day(next_match_day)
+
+    standings = LeagueTable.objects.filter(match_day=next_match_day)
+    assert standings.count() == 4
+    assert standings.get(team=team1).played == 2
+    assert standings.get(team=team2).wins == 1
+    assert standings.get(team=team3).played == 1  # Carried forward
+    assert list(standings.order_by("position").values_list("team", flat=True)) == [
+        team2.pk,
+        team1.pk,
+        team3.pk,
+        team4.pk,
+    ]
+
+
+@pytest.mark.parametrize("num_matches", [1, 5])
+def test_standings_query_count_is_constant(db, num_matches, django_assert_num_queries):
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    match_day = MatchDay.objects.create(
+        season=season, round_number=1, date="2023-01-01"
+    )
+    for index in range(num_matches):
+        Match.objects.create(
+            match_day=match_day,
+            home_team=Team.objects.create(name=f"Home {index}"),
+            away_team=Team.objects.create(name=f"Away {index}"),
+            date=match_day.date,
+        )
+    Match.objects.update(status=Match.Status.FINISHED)
+
+    # Savepoint, previous match day, match scores, delete, insert, release
+    with django_assert_num_queries(6):
+        update_standings_for_new_match_day(match_day)
+
+    assert LeagueTable.objects.filter(match_day=match_day).count() == num_matches * 2
+
+    # Rebuilding also reads the rows it deletes, for their signals
+    with django_assert_num_queries(7):
+        update_standings_for_new_match_day(match_day)
+
+
+def set_segment_score(match, segment_number, home_score, away_score):
+    """
+    Change a segment score without sending signals, as a bulk correction would.
+    """
+    match.segments.filter(segment_number=segment_number).update(
+        home_score=home_score, away_score=away_score
+    )
+    match.update_totals()
+
+
+@pytest.fixture
+def two_round_season(db):
+    post_save.disconnect(update_standings_on_match_update, sender=Match)
+
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    team1 = Team.objects.create(name="Team 1")
+    team2 = Team.objects.create(name="Team 2")
+
+    matches = []
+    for round_number, (home_team, away_team) in enumerate(
+        [(team1, team2), (team2, team1)], start=1
+    ):
+        match_day = MatchDay.objects.create(
+            season=season, round_number=round_number, date=f"2023-01-0{round_number}"
+        )
+        match = Match.objects.create(
+            match_day=match_day,
+            home_team=home_team,
+            away_team=away_team,
+            date=match_day.date,
+            status=Match.Status.FINISHED,
+        )
+        set_segment_score(match, 1, 3, 1)
+        update_standings_for_new_match_day(match_day)
+        matches.append(match)
+
+    post_save.connect(update_standings_on_match_update, sender=Match)
+
+    return {"teams": [team1, team2], "matches": matches}
+
+
+def snapshot(match_day):
+    return list(
+        LeagueTable.objects.filter(match_day=match_day)
+        .order_by("team")
+        .values("team", "position", *STAT_FIELDS)
+    )
+
+
+def rebuilt_snapshots(matches):
+    for match in matches:
+        update_standings_for_new_match_day(match.match_day)
+    return [snapshot(match.match_day) for match in matches]
+
+
+def test_repair_cascades_to_later_match_days(two_round_season):
+    first_match, second_match = two_round_season["matches"]
+    team2 = two_round_season["teams"][1]
+    set_segment_score(first_match, 1, 0, 5)
+
+    repair_standings_for_matches([first_match])
+
+    repaired = [snapshot(first_match.match_day), snapshot(second_match.match_day)]
+    assert repaired == rebuilt_snapshots(two_round_season["matches"])
+    team2_standing = LeagueTable.objects.get(
+        match_day=second_match.match_day, team=team2
+    )
+    assert (team2_standing.wins, team2_standing.losses) == (2, 0)
+    assert team2_standing.position == 1
+
+
+def test_repair_applies_several_corrections_at_once(two_round_season):
+    first_match, second_match = two_round_season["matches"]
+    set_segment_score(first_match, 1, 2, 2)
+    set_segment_score(second_match, 2, 0, 4)
+
+    repair_standings_for_matches([second_match, first_match])
+    repair_standings_for_matches([first_match, second_match])  # Idempotent
+
+    repaired = [snapshot(first_match.match_day), snapshot(second_match.match_day)]
+    assert repaired == rebuilt_snapshots(two_round_season["matches"])
+
+
+def test_corrected_segment_score_repairs_standings(two_round_season):
+    first_match, second_match = two_round_season["matches"]
+    team1 = two_round_season["teams"][0]
+
+    segment = first_match.segments.get(segment_number=1)
+    segment.home_score = 7
+    segment.save()
+
+    standing = LeagueTable.objects.get(match_day=second_match.match_day, team=team1)
+    assert (standing.goals_for, standing.goals_against) == (8, 4)
+
+
+def test_current_standings_returns_latest_snapshot(
+    two_round_season, django_assert_num_queries
+):
+    first_match, second_match = two_round_season["matches"]
+    season = second_match.match_day.season
+    MatchDay.objects.create(season=season, round_number=3, date="2023-01-03")
+
+    with django_assert_num_queries(1):
+        standings = list(LeagueTable.objects.current_standings(season))
+
+    assert [standing.match_day_id for standing in standings] == [
+        second_match.match_day_id
+    ] * 2
+    assert [standing.position for standing in standings] == [1, 2]
+
+
+def test_standings_history_pads_missing_rounds(two_round_season):
+    first_match, second_match = two_round_season["matches"]
+    team1, team2 = two_round_season["teams"]
+    LeagueTable.objects.filter(match_day=first_match.match_day, team=team1).delete()
+
+    history = build_standings_history(first_match.match_day.season_id)
+
+    assert history["rounds"] == [1, 2]
+    series = {team["id"]: team["points"] for team in history["teams"]}
+    assert series == {team2.pk: [0, 3], team1.pk: [None, 3]}
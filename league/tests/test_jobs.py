@@ -0,0 +1,159 @@
+import io
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from league import jobs
+from league.models import Job
+
+
+@pytest.fixture
+def failing_task(mocker):
+    task = mocker.Mock(side_effect=RuntimeError("boom"))
+    mocker.patch.dict(jobs.TASKS, {"failing_task": task})
+    return task
+
+
+@pytest.fixture
+def recording_task(mocker):
+    task = mocker.Mock()
+    mocker.patch.dict(jobs.TASKS, {"recording_task": task})
+    return task
+
+
+@pytest.mark.django_db
+def test_identical_pending_jobs_are_enqueued_once(recording_task):
+    first = jobs.enqueue("recording_task", match_day_id=1)
+    second = jobs.enqueue("recording_task", match_day_id=1)
+    other = jobs.enqueue("recording_task", match_day_id=2)
+
+    assert first == second
+    assert Job.objects.count() == 2
+    assert other.arguments == {"match_day_id": 2}
+
+
+@pytest.mark.django_db
+def test_running_job_no_longer_deduplicates(recording_task):
+    job = jobs.enqueue("recording_task", match_day_id=1)
+    assert jobs.claim_next_job() == job
+
+    assert jobs.enqueue("recording_task", match_day_id=1) != job
+
+
+@pytest.mark.django_db
+def test_unknown_task_is_rejected():
+    with pytest.raises(ValueError):
+        jobs.enqueue("no_such_task")
+
+
+@pytest.mark.django_db
+def test_run_pending_jobs(recording_task):
+    job = jobs.enqueue("recording_task", match_day_id=1)
+
+    assert jobs.run_pending_jobs() == 1
+
+    recording_task.assert_called_once_with(match_day_id=1)
+    job.refresh_from_db()
+    assert job.status == Job.Status.DONE
+    assert job.attempts == 1
+
+
+@pytest.mark.django_db
+def test_failed_job_is_retried_later_then_given_up(failing_task):
+    job = jobs.enqueue("failing_task")
+
+    jobs.run_pending_jobs()
+
+    job.refresh_from_db()
+    assert job.status == Job.Status.PENDING
+    assert job.run_after > timezone.now()
+    assert "boom" in job.last_error
+
+    for _ in range(job.max_attempts - 1):
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending_jobs()
+
+    job.refresh_from_db()
+    assert job.status == Job.Status.FAILED
+    assert failing_task.call_count == job.max_attempts
+
+
+@pytest.mark.django_db
+def test_job_waiting_for_its_retry_deduplicates(failing_task):
+    job = jobs.enqueue("failing_task", match_day_id=1)
+    jobs.run_pending_jobs()
+
+    assert jobs.enqueue("failing_task", match_day_id=1) == job
+    assert Job.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_retry_is_left_to_an_identical_job_enqueued_meanwhile(failing_task):
+    job = jobs.enqueue("failing_task", match_day_id=1)
+    jobs.claim_next_job()
+    newer = jobs.enqueue("failing_task", match_day_id=1)
+
+    jobs.run_job(job)
+
+    job.refresh_from_db()
+    assert job.status == Job.Status.FAILED
+    assert Job.objects.get(dedupe_key__isnull=False) == newer
+
+
+@pytest.mark.django_db
+def test_job_left_running_is_claimed_again_after_its_lease(recording_task):
+    job = jobs.enqueue("recording_task")
+    jobs.claim_next_job()  # The worker stops without finishing the job
+
+    assert jobs.claim_next_job() is None
+    Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+
+    assert jobs.run_pending_jobs() == 1
+    job.refresh_from_db()
+    assert job.status == Job.Status.DONE
+    assert job.attempts == 2
+    assert job.locked_until is None
+    assert job.last_error == jobs.LOST_JOB_ERROR
+
+
+@pytest.mark.django_db
+def test_job_left_running_fails_after_its_last_attempt(recording_task):
+    job = jobs.enqueue("recording_task")
+    jobs.claim_next_job()
+    Job.objects.filter(pk=job.pk).update(
+        attempts=job.max_attempts, locked_until=timezone.now()
+    )
+
+    assert jobs.run_pending_jobs() == 0
+    job.refresh_from_db()
+    assert job.status == Job.Status.FAILED
+    assert not recording_task.called
+
+
+@pytest.mark.django_db
+def test_admin_retries_jobs_left_running(admin_client, recording_task):
+    running = jobs.enqueue("recording_task", number=1)
+    stale = jobs.enqueue("recording_task", number=2)
+    jobs.claim_next_job()
+    jobs.claim_next_job()
+    Job.objects.filter(pk=stale.pk).update(locked_until=timezone.now())
+
+    admin_client.post(
+        reverse("admin:league_job_changelist"),
+        {"action": "retry_jobs", "_selected_action": [running.pk, stale.pk]},
+    )
+
+    assert Job.objects.get(pk=running.pk).status == Job.Status.RUNNING
+    assert Job.objects.get(pk=stale.pk).status == Job.Status.PENDING
+
+
+@pytest.mark.django_db
+def test_run_jobs_command(recording_task):
+    jobs.enqueue("recording_task")
+
+    out = io.StringIO()
+    call_command("run_jobs", "--once", stdout=out)
+
+    assert "Ran 1 jobs." in out.getvalue()
+    assert recording_task.called
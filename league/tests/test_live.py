@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import json
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+from league.live import broker, match_day_topic, match_topic
+from league.models import League, Match, Season, SeasonTeam, Team
+
+
+@pytest.fixture
+def match(db):
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    for name in ["Team 1", "Team 2"]:
+        SeasonTeam.objects.create(season=season, team=Team.objects.create(name=name))
+    season.generate_matches(datetime.date(2023, 1, 1), 7, legs=1)
+    return Match.objects.get()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def subscribe(loop, topic):
+    async def _subscribe():
+        return broker.subscribe(topic)
+
+    return loop.run_until_complete(_subscribe())
+
+
+def received(loop, subscription):
+    """
+    Return the events delivered to a subscription so far.
+    """
+    loop.run_until_complete(asyncio.sleep(0))  # Run the pending deliveries
+    events = []
+    while not subscription.queue.empty():
+        message = subscription.queue.get_nowait().decode()
+        event, data = message.strip().split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data[6:])))
+    return events
+
+
+def test_events_are_fanned_out_from_any_thread(loop):
+    subscriptions = [subscribe(loop, "topic") for _ in range(3)]
+    other = subscribe(loop, "other")
+
+    thread = threading.Thread(
+        target=broker.publish, args=(["topic"], "segment", {"score": 1})
+    )
+    thread.start()
+    thread.join()
+
+    for subscription in subscriptions:
+        assert received(loop, subscription) == [("segment", {"score": 1})]
+    assert received(loop, other) == []
+    for subscription in [*subscriptions, other]:
+        broker.unsubscribe(subscription)
+    assert broker.subscriber_count("topic") == 0
+
+
+def test_score_changes_are_published_on_commit(
+    match, loop, django_capture_on_commit_callbacks
+):
+    match_subscription = subscribe(loop, match_topic(match.pk))
+    match_day_subscription = subscribe(loop, match_day_topic(match.match_day_id))
+    match.status = Match.Status.IN_PROGRESS
+    match.save()
+    segment = match.segments.get(segment_number=1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        segment.home_score, segment.away_score = 7, 2
+        segment.save()
+        assert received(loop, match_subscription) == []  # Not committed yet
+
+    match_event = {
+        "match": match.pk,
+        "status": "In Progress",
+        "status_display": "In Progress",
+        "home_score": 7,
+        "away_score": 2,
+    }
+    assert received(loop, match_subscription) == [
+        (
+            "segment",
+            {"match": match.pk, "segment": 1, "home_score": 7, "away_score": 2},
+        ),
+        ("match", match_event),
+    ]
+    assert received(loop, match_day_subscription) == [("match", match_event)]
+    broker.unsubscribe(match_subscription)
+    broker.unsubscribe(match_day_subscription)
+
+
+@pytest.mark.django_db
+def test_event_streams(match):
+    @async_to_sync
+    async def first_chunk(url):
+        response = await AsyncClient().get(url)
+        chunk = await anext(response.streaming_content)
+        await response.streaming_content.aclose()
+        return response, chunk
+
+    response, chunk = first_chunk(reverse("match_events", args=[match.pk]))
+    assert response["Content-Type"] == "text/event-stream"
+    assert chunk == b"retry: 5000\n\n"
+    assert broker.subscriber_count(match_topic(match.pk)) == 0
+
+    response, chunk = first_chunk(
+        reverse("match_day_events", args=[match.match_day_id])
+    )
+    assert chunk.startswith(b"retry:")
+
+
+@pytest.mark.django_db
+def test_event_stream_of_unknown_match():
+    @async_to_sync
+    async def get(url):
+        return await AsyncClient().get(url)
+
+    assert get(reverse("match_events", args=[0])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_live_scores_need_asgi(client, match):
+    page_urls = [
+        reverse("match_detail", args=[match.pk]),
+        reverse("match_day_detail", args=[match.match_day_id]),
+    ]
+    event_urls = [
+        reverse("match_events", args=[match.pk]),
+        reverse("match_day_events", args=[match.match_day_id]),
+    ]
+
+    for url in event_urls:
+        assert client.get(url).status_code == 204
+    for url in page_urls:
+        assert b"EventSource" not in client.get(url).content
+
+    @async_to_sync
+    async def get_pages():
+        return [await AsyncClient().get(url) for url in page_urls]
+
+    for response in get_pages():
+        assert b"EventSource" in response.content
@@ -0,0 +1,256 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from league.models import (
+    League,
+    Match,
+    MatchDay,
+    Player,
+    PlayerSeasonStats,
+    Season,
+    SeasonTeam,
+    SegmentScore,
+    Team,
+)
+
+
+def create_season(num_teams, year=2023):
+    league = League.objects.create(name=f"League {year}")
+    season = Season.objects.create(year=year, league=league)
+    for index in range(1, num_teams + 1):
+        team = Team.objects.create(name=f"Team {index}")
+        SeasonTeam.objects.create(season=season, team=team)
+    return season
+
+
+@pytest.mark.django_db
+def test_generate_matches_double_round_robin():
+    season = create_season(4)
+
+    season.generate_matches(datetime.date(2023, 1, 1), 7)
+
+    assert MatchDay.objects.filter(season=season).count() == 6
+    assert Match.objects.filter(match_day__season=season).count() == 12
+    assert SegmentScore.objects.filter(match__match_day__season=season).count() == 84
+
+    pairings = Match.objects.filter(match_day__season=season).values_list(
+        "home_team", "away_team"
+    )
+    assert len(set(pairings)) == 12  # Every team hosts every other team once
+
+
+@pytest.mark.django_db
+def test_generate_matches_creates_segments_in_order():
+    season = create_season(2)
+
+    season.generate_matches(datetime.date(2023, 1, 1), 7)
+
+    for match in Match.objects.filter(match_day__season=season):
+        segments = match.segments.order_by("segment_number")
+        assert [segment.segment_type for segment in segments] == [
+            "D1",
+            "D2",
+            "S1",
+            "D3",
+            "S2",
+            "D4",
+            "D5",
+        ]
+
+
+@pytest.mark.django_db
+def test_generate_matches_skips_bye_with_odd_number_of_teams():
+    season = create_season(5)
+
+    season.generate_matches(datetime.date(2023, 1, 1), 7)
+
+    assert MatchDay.objects.filter(season=season).count() == 10
+    assert Match.objects.filter(match_day__season=season).count() == 20
+    assert not Team.objects.filter(name="BYE").exists()
+
+
+@pytest.mark.django_db
+def test_generate_matches_query_count_benchmark(mocker):
+    """
+    Benchmark: generating a schedule costs the same number of queries whatever
+    the number of teams.
+    """
+    # SQLite splits bulk inserts at 999 parameters, MySQL sends them whole.
+    mocker.patch.object(
+        connection.ops, "bulk_batch_size", side_effect=lambda fields, objs: len(objs)
+    )
+
+    query_counts = []
+    for year, num_teams in enumerate([4, 8, 12, 20], start=2000):
+        season = create_season(num_teams, year=year)
+        with CaptureQueriesContext(connection) as queries:
+            season.generate_matches(datetime.date(year, 1, 1), 7)
+        query_counts.append(len(queries))
+
+    assert Match.objects.filter(match_day__season=season).count() == 380
+    assert len(set(query_counts)) == 1
+
+
+@pytest.fixture
+def match(db):
+    season = create_season(2)
+    match_day = MatchDay.objects.create(
+        season=season, round_number=1, date="2023-01-01"
+    )
+    home_team, away_team = season.teams.all()
+    return Match.objects.create(
+        match_day=match_day,
+        home_team=home_team,
+        away_team=away_team,
+        date=match_day.date,
+        status=Match.Status.IN_PROGRESS,
+    )
+
+
+def test_match_totals_follow_segment_changes(match):
+    for segment in match.segments.filter(segment_number__lte=2):
+        segment.home_score = 7
+        segment.away_score = 3
+        segment.save()
+
+    match.refresh_from_db()
+    assert (match.home_total, match.away_total) == (14, 6)
+
+    match.segments.get(segment_number=1).delete()
+
+    match.refresh_from_db()
+    assert (match.home_score, match.away_score) == (7, 3)
+
+
+def test_saving_a_stale_match_keeps_totals(match):
+    stale_match = Match.objects.get(pk=match.pk)
+    segment = match.segments.get(segment_number=1)
+    segment.home_score = 5
+    segment.away_score = 2
+    segment.save()
+
+    stale_match.date = datetime.date(2023, 1, 2)
+    stale_match.save()
+
+    match.refresh_from_db()
+    assert (match.home_total, match.away_total) == (5, 2)
+
+
+def test_scores_are_read_without_queries(match, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        assert (match.home_score, match.away_score) == (0, 0)
+
+    match.status = Match.Status.NOT_STARTED
+    assert match.home_score is None
+
+
+def test_sync_match_totals_command(match):
+    match.segments.filter(segment_number=1).update(home_score=4, away_score=3)
+
+    with pytest.raises(CommandError):
+        call_command("sync_match_totals", "--check", stdout=io.StringIO())
+
+    call_command("sync_match_totals", stdout=io.StringIO())
+
+    match.refresh_from_db()
+    assert (match.home_total, match.away_total) == (4, 3)
+    call_command("sync_match_totals", "--check", stdout=io.StringIO())
+
+
+def test_sync_player_stats_command(match):
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    segment = match.segments.get(segment_number=1)
+    segment.home_players.set([player])
+    match.segments.filter(pk=segment.pk).update(home_score=4, away_score=3)
+    assert not PlayerSeasonStats.objects.exists()
+
+    call_command("sync_player_stats", stdout=io.StringIO())
+
+    stats = PlayerSeasonStats.objects.get(player=player)
+    assert (stats.doubles_won, stats.points_for, stats.points_against) == (1, 4, 3)
+
+
+def test_sync_player_stats_command_removes_players_out_of_lineups(match):
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    PlayerSeasonStats.objects.create(
+        player=player, season=match.match_day.season, doubles_won=1
+    )
+
+    call_command("sync_player_stats", stdout=io.StringIO())
+
+    assert not PlayerSeasonStats.objects.filter(player=player).exists()
+
+
+def test_running_totals_from_a_single_query(match, django_assert_num_queries):
+    for segment in match.segments.filter(segment_number__in=[1, 3]):
+        segment.home_score = 7
+        segment.away_score = segment.segment_number
+        segment.save()
+
+    with django_assert_num_queries(1):
+        segments = list(
+            SegmentScore.objects.with_running_totals()
+            .filter(match=match)
+            .order_by("segment_number")
+        )
+        totals = [(s.total_home_score, s.total_away_score) for s in segments]
+
+    assert totals == [(7, 1), (7, 1), (14, 4), (14, 4), (14, 4), (14, 4), (14, 4)]
+    assert (
+        segments[2].total_home_score
+        == match.segments.get(segment_number=3).total_home_score
+    )
+
+
+def test_running_totals_use_unsaved_segment_score(match):
+    match.segments.filter(segment_number=1).update(home_score=3)
+    segment = (
+        SegmentScore.objects.with_running_totals()
+        .filter(match=match)
+        .order_by("segment_number")[1]
+    )
+
+    segment.home_score = 7
+
+    assert segment.total_home_score == 10
+
+
+def test_match_day_progress(match, django_assert_num_queries):
+    match_day = match.match_day
+    assert not match_day.completed
+
+    with django_assert_num_queries(1):
+        annotated = MatchDay.objects.with_progress().get(pk=match_day.pk)
+        assert (annotated.finished_match_count, annotated.match_count) == (0, 1)
+        assert not annotated.completed
+
+    Match.objects.filter(pk=match.pk).update(status=Match.Status.FINISHED)
+
+    assert match_day.completed
+    assert MatchDay.objects.with_progress().get(pk=match_day.pk).completed
+
+
+@pytest.mark.django_db
+def test_player_search_matches_folded_name_prefixes():
+    eva = Player.objects.create(first_name="Éva", last_name="Müller")
+    Player.objects.create(first_name="Evan", last_name="Smith")
+    Player.objects.create(first_name="Ada", last_name="Eveleigh")
+
+    assert (eva.search_name, eva.search_name_reversed) == ("eva muller", "muller eva")
+    assert set(Player.objects.search("  EVA ")) == {
+        eva,
+        *Player.objects.filter(first_name="Evan"),
+    }
+    assert list(Player.objects.search("mül")) == [eva]
+    assert list(Player.objects.search("muller e")) == [eva]
+    assert Player.objects.search("eveleigh ada").get().first_name == "Ada"
+    assert not Player.objects.search("ller").exists()  # Prefixes only
+
+    eva.last_name = "Schmidt"
+    eva.save(update_fields=["last_name"])
+    assert list(Player.objects.search("schmidt")) == [eva]
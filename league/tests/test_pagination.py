@@ -0,0 +1,109 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from league.models import Player, Team, Venue
+
+
+@pytest.fixture
+def teams(db):
+    venues = [
+        Venue.objects.create(name=f"Venue {i}", city="", address="") for i in range(3)
+    ]
+    # Duplicate names and missing venues exercise the tie breaker and NULLs
+    return [
+        Team.objects.create(
+            name=f"Team {index % 9:02}",
+            venue=venues[index % 4] if index % 4 < 3 else None,
+        )
+        for index in range(25)
+    ]
+
+
+SORT_KEYS = {
+    "name": lambda team: (team.name, team.pk),
+    "-name": lambda team: ([-ord(char) for char in team.name], team.pk),
+    # NULLs first ascending and last descending, the primary key breaks ties
+    "venue": lambda team: (team.venue_id is not None, team.venue_id or 0, team.pk),
+    "-venue": lambda team: (team.venue_id is None, -(team.venue_id or 0), team.pk),
+}
+
+
+def walk(client, url, params, direction="next_cursor"):
+    """
+    Follow the cursors from the page at `params`, returning the records of
+    every page and the number of queries of each request.
+    """
+    pages, query_counts = [], []
+    while True:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, params, HTTP_HX_REQUEST="true")
+        query_counts.append(len(queries))
+        page = response.context["table"].page
+        pages.append([row.record for row in page.object_list])
+        cursor = getattr(page, direction)
+        if cursor is None:
+            return pages, query_counts, response
+        params = {**params, "cursor": cursor}
+
+
+@pytest.mark.parametrize("sort", ["name", "-name", "venue", "-venue"])
+def test_keyset_pages_cover_every_team_once(client, teams, sort):
+    url = reverse("team_list")
+
+    pages, query_counts, response = walk(client, url, {"sort": sort})
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    records = [team for page in pages for team in page]
+    assert records == sorted(teams, key=SORT_KEYS[sort])
+    assert len(set(query_counts)) == 1  # Deep pages cost the same as the first
+
+    last_cursor = response.context["table"].page.previous_cursor
+    back, _, _ = walk(
+        client, url, {"sort": sort, "cursor": last_cursor}, "previous_cursor"
+    )
+    assert back == pages[-2::-1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "count, expected_queries", [("exact", 1), ("estimate", 1), (None, 0)]
+)
+def test_keyset_count_modes(client, mocker, count, expected_queries):
+    for index in range(3):
+        Player.objects.create(first_name="Player", last_name=str(index))
+    mocker.patch("league.views.PlayerListView.keyset_count", count)
+    url = reverse("player_list")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, HTTP_HX_REQUEST="true")
+
+    counts = [q["sql"] for q in queries if "COUNT(" in q["sql"].upper()]
+    assert len(counts) == expected_queries
+    assert response.context["table"].paginator.count == (None if count is None else 3)
+
+
+@pytest.mark.django_db
+def test_keyset_count_estimate_is_capped(client, mocker):
+    mocker.patch("league.pagination.COUNT_LIMIT", 2)
+    for index in range(3):
+        Player.objects.create(first_name="Player", last_name=str(index))
+
+    response = client.get(reverse("player_list"))
+
+    assert b"More than 2 results" in response.content
+
+
+@pytest.mark.django_db
+def test_stale_cursor_starts_from_the_first_page(client):
+    for index in range(12):
+        Player.objects.create(first_name="Player", last_name=f"{index:02}")
+    url = reverse("player_list")
+    cursor = client.get(url).context["table"].page.next_cursor
+
+    response = client.get(url, {"cursor": cursor, "o": "-first_name"})
+    assert not response.context["table"].page.has_previous()
+
+    response = client.get(url, {"cursor": "not a cursor"})
+    assert response.status_code == 200
+    assert not response.context["table"].page.has_previous()
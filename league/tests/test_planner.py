@@ -0,0 +1,54 @@
+import dataclasses
+import datetime
+
+import pytest
+from league.planner import Fixture, plan_fixtures
+
+START_DATE = datetime.date(2023, 1, 1)
+
+
+@pytest.mark.parametrize("num_teams", [2, 4, 5, 8])
+def test_every_pairing_is_played_once_per_leg(num_teams):
+    teams = [f"Team {index}" for index in range(num_teams)]
+
+    plan = plan_fixtures(teams, START_DATE, 7, legs=2)
+
+    pairings = [(fixture.home, fixture.away) for fixture in plan.fixtures]
+    assert len(pairings) == num_teams * (num_teams - 1)
+    assert len(set(pairings)) == len(pairings)
+
+
+def test_teams_play_at_most_once_per_round():
+    plan = plan_fixtures(list("ABCDEFG"), START_DATE, 7, legs=1)
+
+    assert len(plan) == 7
+    for planned_round in plan:
+        teams = [team for f in planned_round.fixtures for team in (f.home, f.away)]
+        assert len(teams) == len(set(teams)) == 6  # One team has a bye
+        assert None not in teams
+
+
+def test_round_dates_leave_a_free_week_between_legs():
+    plan = plan_fixtures(["A", "B", "C", "D"], START_DATE, 7, legs=2)
+
+    assert [planned_round.round_number for planned_round in plan] == [1, 2, 3, 4, 5, 6]
+    assert [planned_round.date.day for planned_round in plan] == [1, 8, 15, 29, 5, 12]
+
+
+def test_second_leg_mirrors_first_leg():
+    plan = plan_fixtures(["A", "B", "C", "D"], START_DATE, 7, legs=2)
+
+    first_leg, second_leg = plan.rounds[:3], plan.rounds[3:]
+    for first, second in zip(first_leg, second_leg):
+        assert second.fixtures == tuple(Fixture(f.away, f.home) for f in first.fixtures)
+
+
+def test_plan_is_immutable():
+    plan = plan_fixtures(["A", "B"], START_DATE, 7)
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.rounds[0].fixtures[0].home = "C"
+
+
+def test_insufficient_teams_gives_empty_plan():
+    assert not plan_fixtures(["A"], START_DATE, 7)
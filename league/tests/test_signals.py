@@ -1,8 +1,25 @@
 import pytest
+from django.db import connection, transaction
 from django.db.models.signals import post_save
-from league.models import League, Match, MatchDay, Team, Season
+from django.test.utils import CaptureQueriesContext
+from league.jobs import run_pending_jobs
+from league.live import broker
+from league.models import (
+    League,
+    LeagueTable,
+    Match,
+    MatchDay,
+    Player,
+    PlayerSeasonStats,
+    Team,
+    Season,
+)
 
-from league.signals import update_standings_on_match_update
+from league.signals import (
+    defer_match_update,
+    deferred_match_updates,
+    update_standings_on_match_update,
+)
 
 
 @pytest.fixture
@@ -44,14 +61,12 @@ def test_update_standings_signal_not_called_with_unfinished_matches(
 ):
     match_day = partial_match_day_setup
 
-    mock_update_standings = mocker.patch(
-        "league.signals.update_standings_for_new_match_day"
-    )
+    mock_enqueue = mocker.patch("league.signals.enqueue")
 
     for match in Match.objects.filter(match_day=match_day):
         post_save.send(sender=Match, instance=match, created=False)
 
-    mock_update_standings.assert_not_called()
+    mock_enqueue.assert_not_called()
 
 
 @pytest.fixture
@@ -95,11 +110,200 @@ def finished_match_day_setup(db):
 def test_update_standings_signal_called(finished_match_day_setup, mocker):
     match_day = finished_match_day_setup
 
-    mock_update_standings = mocker.patch(
-        "league.signals.update_standings_for_new_match_day"
-    )
+    mock_enqueue = mocker.patch("league.signals.enqueue")
 
     for match in Match.objects.filter(match_day=match_day):
         post_save.send(sender=Match, instance=match, created=False)
 
-    assert mock_update_standings.call_count == 2
+    assert mock_enqueue.call_count == 2
+    mock_enqueue.assert_called_with("update_standings", match_day_id=match_day.pk)
+
+
+@pytest.fixture
+def in_progress_match(db):
+    league = League.objects.create(name="Test League")
+    season = Season.objects.create(year=2023, league=league)
+    match_day = MatchDay.objects.create(
+        season=season, round_number=1, date="2023-01-01"
+    )
+    return Match.objects.create(
+        match_day=match_day,
+        home_team=Team.objects.create(name="Team 1"),
+        away_team=Team.objects.create(name="Team 2"),
+        date=match_day.date,
+        status=Match.Status.IN_PROGRESS,
+    )
+
+
+def score_all_segments(match):
+    for segment in match.segments.all():
+        segment.home_score = 7
+        segment.away_score = 4
+        segment.save()
+
+
+def test_deferred_updates_conclude_match_after_commit(
+    in_progress_match, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with deferred_match_updates():
+            score_all_segments(in_progress_match)
+
+            match = Match.objects.get(pk=in_progress_match.pk)
+            assert match.status == Match.Status.IN_PROGRESS
+            assert match.home_total == 0
+
+    # A single conclusion, besides the events of the live scoreboards
+    conclusions = [
+        callback
+        for callback in callbacks
+        if getattr(callback, "func", None) != broker.publish
+    ]
+    assert len(conclusions) == 1
+    match = Match.objects.get(pk=in_progress_match.pk)
+    assert match.status == Match.Status.FINISHED
+    assert (match.home_total, match.away_total) == (49, 28)
+
+    run_pending_jobs()
+    assert LeagueTable.objects.filter(match_day=match.match_day).count() == 2
+
+
+def test_commit_callbacks_run_after_the_deferral(transactional_db, in_progress_match):
+    seen = []
+    with deferred_match_updates():
+        segment = in_progress_match.segments.first()
+        transaction.on_commit(lambda: seen.append(defer_match_update(segment)))
+
+    assert seen == [False]
+
+
+def test_deferred_updates_save_queries(
+    in_progress_match, django_capture_on_commit_callbacks
+):
+    with CaptureQueriesContext(connection) as immediate:
+        score_all_segments(in_progress_match)
+
+    match_day = MatchDay.objects.create(
+        season=in_progress_match.match_day.season, round_number=2, date="2023-01-08"
+    )
+    other_match = Match.objects.create(
+        match_day=match_day,
+        home_team=Team.objects.create(name="Team 3"),
+        away_team=Team.objects.create(name="Team 4"),
+        date=match_day.date,
+        status=Match.Status.IN_PROGRESS,
+    )
+    with CaptureQueriesContext(connection) as deferred:
+        with django_capture_on_commit_callbacks(execute=True):
+            with deferred_match_updates():
+                score_all_segments(other_match)
+
+    other_match.refresh_from_db()
+    assert other_match.status == Match.Status.FINISHED
+    assert len(deferred) < len(immediate)
+
+
+def test_deferred_updates_are_discarded_on_rollback(
+    in_progress_match, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(ValueError):
+            with deferred_match_updates():
+                score_all_segments(in_progress_match)
+                raise ValueError
+
+    assert callbacks == []
+    assert in_progress_match.segments.filter(home_score=7).count() == 0
+
+
+def test_starting_a_match_does_not_check_match_day(
+    partial_match_day_setup, django_assert_num_queries
+):
+    match = Match.objects.filter(match_day=partial_match_day_setup).last()
+    match.status = Match.Status.IN_PROGRESS
+
+    # The UPDATE of the match and the season lookup of the page cache
+    with django_assert_num_queries(2):
+        match.save()
+
+
+@pytest.fixture
+def lined_up_match(in_progress_match):
+    players = [
+        Player.objects.create(first_name="Player", last_name=str(index))
+        for index in range(1, 5)
+    ]
+    singles = in_progress_match.segments.get(segment_type="S1")
+    singles.home_players.set([players[0]])
+    singles.away_players.set([players[2]])
+    doubles = in_progress_match.segments.get(segment_type="D1")
+    doubles.home_players.set(players[:2])
+    doubles.away_players.set(players[2:])
+    return in_progress_match, players
+
+
+def player_stats(player):
+    return PlayerSeasonStats.objects.filter(player=player).values(
+        "singles_played",
+        "singles_won",
+        "doubles_played",
+        "doubles_lost",
+        "points_for",
+        "points_against",
+    )
+
+
+def test_player_stats_follow_segment_scores(lined_up_match):
+    match, players = lined_up_match
+    assert not PlayerSeasonStats.objects.exists()  # Nothing scored yet
+
+    score_all_segments(match)
+
+    assert list(player_stats(players[0])) == [
+        {
+            "singles_played": 1,
+            "singles_won": 1,
+            "doubles_played": 1,
+            "doubles_lost": 0,
+            "points_for": 14,
+            "points_against": 8,
+        }
+    ]
+    stats = PlayerSeasonStats.objects.get(player=players[2])
+    assert (stats.segments_played, stats.segments_won) == (2, 0)
+    assert stats.point_difference == -6
+
+
+def test_player_stats_follow_lineup_changes(lined_up_match):
+    match, players = lined_up_match
+    score_all_segments(match)
+
+    singles = match.segments.get(segment_type="S1")
+    singles.home_players.set([players[1]])
+
+    assert player_stats(players[0]).get()["singles_played"] == 0
+    assert player_stats(players[1]).get()["singles_played"] == 1
+
+    match.segments.get(segment_type="D1").delete()
+
+    assert not PlayerSeasonStats.objects.filter(player=players[0]).exists()
+
+
+def test_deferred_updates_refresh_player_stats(
+    lined_up_match, django_capture_on_commit_callbacks
+):
+    match, players = lined_up_match
+    score_all_segments(match)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with deferred_match_updates():
+            singles = match.segments.get(segment_type="S1")
+            singles.home_score = 2
+            singles.save()
+            singles.home_players.set([players[1]])
+
+            # Refreshed once the updates are concluded
+            assert player_stats(players[0]).get()["singles_played"] == 1
+
+    assert player_stats(players[0]).get()["singles_played"] == 0
+    assert player_stats(players[1]).get()["points_against"] == 8
@@ -0,0 +1,667 @@
+import datetime
+import io
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+from league.cache import page_cache_key
+from league.jobs import run_pending_jobs
+from league.models import (
+    League,
+    Match,
+    MatchDay,
+    Player,
+    Season,
+    SeasonTeam,
+    Team,
+    Venue,
+)
+
+
+def create_active_season(num_teams):
+    """
+    Create an active regular season with a generated schedule whose first
+    match day is finished.
+    """
+    league = League.objects.create(name="Test League", type="regular")
+    season = Season.objects.create(year=2023, league=league, active=True)
+    for index in range(1, num_teams + 1):
+        team = Team.objects.create(name=f"Team {index}")
+        SeasonTeam.objects.create(season=season, team=team)
+
+    today = datetime.date.today()
+    season.generate_matches(today - datetime.timedelta(days=7), 7)
+    first_match_day = season.match_days.get(round_number=1)
+    for match in first_match_day.matches.all():
+        match.status = Match.Status.IN_PROGRESS
+        match.save()
+        for segment in match.segments.all():
+            segment.home_score = 7
+            segment.away_score = 5
+            segment.save()
+    return season
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+def public_urls(season):
+    match_day = season.match_days.get(round_number=1)
+    match = match_day.matches.first()
+    return [
+        reverse("home"),
+        reverse("active_league"),
+        reverse("match_day_list", args=[season.pk]),
+        reverse("match_day_detail", args=[match_day.pk]),
+        reverse("match_detail", args=[match.pk]),
+        reverse("team_detail", args=[match.home_team_id]),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_index", range(6))
+def test_public_pages_query_count_is_independent_of_matches(client, url_index):
+    counts = []
+    for num_teams in (4, 8):
+        season = create_active_season(num_teams)
+        counts.append(count_queries(client, public_urls(season)[url_index]))
+        League.objects.all().delete()
+        Team.objects.all().delete()
+
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db
+def test_match_day_detail_shows_scores(client):
+    season = create_active_season(4)
+    match_day = season.match_days.get(round_number=1)
+
+    response = client.get(reverse("match_day_detail", args=[match_day.pk]))
+
+    assert b"49 - 35" in response.content
+
+
+@pytest.mark.django_db
+def test_match_detail_shows_running_score(client):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=1).matches.get()
+
+    response = client.get(reverse("match_detail", args=[match.pk]))
+
+    assert b"21 - 15" in response.content
+    assert b"49 - 35" in response.content
+
+
+@pytest.mark.django_db
+def test_match_day_list_shows_progress(client):
+    season = create_active_season(4)
+
+    response = client.get(reverse("match_day_list", args=[season.pk]))
+
+    assert b"(2/2 finished)" in response.content
+    assert b"(0/2 finished)" in response.content
+
+
+@pytest.mark.django_db
+def test_cached_pages_are_served_without_queries(client, django_assert_num_queries):
+    season = create_active_season(4)
+    match_day = season.match_days.get(round_number=1)
+    url = reverse("match_day_detail", args=[match_day.pk])
+    client.get(url)
+
+    # Validator and season of the match day
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    assert b"49 - 35" in response.content
+
+
+@pytest.mark.django_db
+def test_cached_pages_follow_data_changes(client):
+    season = create_active_season(4)
+    match = season.match_days.get(round_number=2).matches.first()
+    url = reverse("match_day_detail", args=[match.match_day_id])
+    assert b"7 - 0" not in client.get(url).content
+
+    match.status = Match.Status.IN_PROGRESS
+    match.save()
+    segment = match.segments.get(segment_number=1)
+    segment.home_score = 7
+    segment.away_score = 0
+    segment.save()
+
+    assert b"7 - 0" in client.get(url).content
+
+
+@pytest.mark.django_db
+def test_cached_pages_follow_deletions(client):
+    season = create_active_season(4)
+    match = season.match_days.get(round_number=1).matches.first()
+    url = reverse("match_day_detail", args=[match.match_day_id])
+    match_url = reverse("match_detail", args=[match.pk])
+    assert match_url.encode() in client.get(url).content
+
+    match.delete()
+
+    assert match_url.encode() not in client.get(url).content
+
+
+@pytest.mark.django_db
+def test_cached_pages_follow_team_changes(client):
+    season = create_active_season(4)
+    match_day = season.match_days.get(round_number=1)
+    team_list_url = reverse("team_list")
+    match_day_url = reverse("match_day_detail", args=[match_day.pk])
+    client.get(team_list_url)
+    client.get(match_day_url)
+
+    Team.objects.create(name="Newcomers")
+    team = match_day.matches.first().home_team
+    team.name = "Renamed"
+    team.save()
+
+    assert b"Newcomers" in client.get(team_list_url).content
+    assert b"Renamed" in client.get(match_day_url).content
+
+
+@pytest.mark.django_db
+def test_cached_home_page_follows_the_date(client, mocker):
+    create_active_season(4)
+    response = client.get(reverse("home"))
+    next_round = response.context["next_match_day"].round_number
+
+    now = timezone.now() + datetime.timedelta(days=8)
+    mocker.patch("django.utils.timezone.now", return_value=now)
+    response = client.get(reverse("home"))
+
+    assert response.context["next_match_day"].round_number == next_round + 1
+
+
+@pytest.mark.django_db
+def test_active_league_loads_matches_per_match_day(client):
+    season = create_active_season(4)
+    match_day = season.match_days.get(round_number=1)
+    url = reverse("match_day_matches", args=[match_day.pk])
+
+    response = client.get(reverse("active_league"))
+    assert url.encode() in response.content
+    assert b"49 - 35" not in response.content
+
+    response = client.get(url, HTTP_HX_REQUEST="true")
+    assert response.content.count(b"49 - 35") == 2
+
+
+@pytest.mark.django_db
+def test_active_league_query_count_is_independent_of_rounds(client):
+    season = create_active_season(4)
+    url = reverse("active_league")
+    query_count = count_queries(client, url)
+
+    for match_day in season.match_days.filter(round_number__gt=1):
+        for match in match_day.matches.all():
+            match.status = Match.Status.IN_PROGRESS
+            match.save()
+            for segment in match.segments.all():
+                segment.home_score = 7
+                segment.save()
+
+    assert count_queries(client, url) == query_count
+
+
+@pytest.mark.django_db
+def test_active_league_table_shows_current_standings(client):
+    create_active_season(4)
+    run_pending_jobs()
+
+    response = client.get(reverse("active_league"))
+
+    table = response.context["table"]
+    assert [row.record.position for row in table.rows] == [1, 2, 3, 4]
+
+
+@pytest.mark.django_db
+def test_active_league_table_is_sorted_in_memory(client):
+    create_active_season(4)
+    run_pending_jobs()
+
+    response = client.get(reverse("active_league"), {"sort": "-team"})
+
+    table = response.context["table"]
+    names = [row.record.team.name for row in table.rows]
+    assert names == ["Team 4", "Team 3", "Team 2", "Team 1"]
+
+
+@pytest.mark.django_db
+def test_public_pages_are_rendered_on_the_event_loop(django_user_model):
+    season = create_active_season(2)
+    match_day = season.match_days.get(round_number=1)
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    user = django_user_model.objects.create_user(username="ada", password="secret")
+    urls = [
+        reverse("home"),
+        reverse("active_league"),
+        reverse("match_day_list", args=[season.pk]),
+        reverse("match_day_detail", args=[match_day.pk]),
+        reverse("player_detail", args=[player.pk]),
+    ]
+    client = AsyncClient()
+
+    async def get_pages():
+        # A synchronous query from the views would raise here
+        await client.aforce_login(user)
+        return [await client.get(url) for url in urls]
+
+    for response in async_to_sync(get_pages)():
+        assert response.status_code == 200
+        assert b"Welcome, ada!" in response.content
+
+
+def conditional_urls(season):
+    match_day = season.match_days.get(round_number=1)
+    match = match_day.matches.first()
+    return [
+        reverse("active_league"),
+        reverse("match_day_detail", args=[match_day.pk]),
+        reverse("match_detail", args=[match.pk]),
+        reverse("team_detail", args=[match.home_team_id]),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_index", range(4))
+def test_unchanged_pages_are_not_modified(client, django_assert_num_queries, url_index):
+    url = conditional_urls(create_active_season(4))[url_index]
+    response = client.get(url)
+    assert response.has_header("Last-Modified")
+
+    with django_assert_num_queries(1):  # The validator
+        response = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_index", range(4))
+def test_modified_pages_are_sent_again(client, url_index):
+    season = create_active_season(4)
+    url = conditional_urls(season)[url_index]
+    etag = client.get(url)["ETag"]
+
+    match = season.match_days.get(round_number=1).matches.first()
+    segment = match.segments.get(segment_number=1)
+    segment.home_score = 6
+    segment.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_index", range(2))
+def test_pages_are_sent_again_after_a_deletion(client, url_index):
+    season = create_active_season(4)
+    url = conditional_urls(season)[url_index]
+    match_day = season.match_days.get(round_number=1)
+    first_match, second_match = match_day.matches.all()
+
+    # A segment deleted on its own updates the totals of its match
+    etag = client.get(url)["ETag"]
+    first_match.segments.get(segment_number=1).delete()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+    etag = response["ETag"]
+    second_match.delete()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_match_page_is_sent_again_after_a_lineup_change(client):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=1).matches.get()
+    url = reverse("match_detail", args=[match.pk])
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    # Only the lineup changes, not the player
+    Player.objects.filter(pk=player.pk).update(
+        updated_at=timezone.now() - datetime.timedelta(days=1)
+    )
+    etag = client.get(url)["ETag"]
+
+    match.segments.get(segment_number=1).home_players.add(player)
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"Ada Lovelace" in response.content
+    etag = response["ETag"]
+
+    player.home_segments.clear()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"Ada Lovelace" not in response.content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_index", range(4))
+def test_pages_are_sent_again_after_a_team_change(client, url_index):
+    season = create_active_season(4)
+    run_pending_jobs()  # The standings list the teams
+    url = conditional_urls(season)[url_index]
+    etag = client.get(url)["ETag"]
+
+    team = season.match_days.get(round_number=1).matches.first().home_team
+    team.name = "Renamed"
+    team.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"Renamed" in response.content
+
+
+@pytest.mark.django_db
+def test_pages_are_sent_again_after_a_venue_or_player_change(client):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=1).matches.get()
+    venue = Venue.objects.create(name="Old Hall", city="Berlin", address="Street 1")
+    Team.objects.filter(pk=match.home_team_id).update(venue=venue)
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    match.segments.get(segment_number=1).home_players.set([player])
+    SeasonTeam.objects.get(team_id=match.home_team_id).players.set([player])
+    urls = [
+        reverse("match_detail", args=[match.pk]),
+        reverse("team_detail", args=[match.home_team_id]),
+    ]
+    changes = [("New Hall", venue, "name"), ("Byron", player, "last_name")]
+
+    etags = {url: client.get(url)["ETag"] for url in urls}
+    for value, instance, field in changes:
+        setattr(instance, field, value)
+        instance.save()
+        for url in urls:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            assert response.status_code == 200
+            assert value.encode() in response.content
+            etags[url] = response["ETag"]
+
+
+@pytest.mark.django_db
+def test_etag_varies_by_language(client):
+    season = create_active_season(2)
+    url = conditional_urls(season)[0]
+
+    english = client.get(url, HTTP_ACCEPT_LANGUAGE="en")
+    german = client.get(
+        url, HTTP_ACCEPT_LANGUAGE="de", HTTP_IF_NONE_MATCH=english["ETag"]
+    )
+
+    assert german.status_code == 200
+    assert german["ETag"] != english["ETag"]
+
+
+def test_page_cache_key_varies_by_language_and_htmx(rf):
+    request = rf.get("/active-league/")
+    request.htmx = False
+
+    with translation.override("en"):
+        english_key = page_cache_key(request, 1)
+    with translation.override("de"):
+        german_key = page_cache_key(request, 1)
+        request.htmx = True
+        htmx_key = page_cache_key(request, 1)
+
+    assert len({english_key, german_key, htmx_key}) == 3
+
+
+@pytest.mark.django_db
+def test_standings_history(client, django_assert_num_queries):
+    season = create_active_season(4)
+    run_pending_jobs()
+    url = reverse("standings_history", args=[season.pk])
+
+    with django_assert_num_queries(1):
+        history = client.get(url).json()
+
+    assert history["rounds"] == [1]
+    assert len(history["teams"]) == 4
+    assert sorted(team["position"][0] for team in history["teams"]) == [1, 2, 3, 4]
+    with django_assert_num_queries(0):
+        assert client.get(url).json() == history
+
+
+@pytest.mark.django_db
+def test_standings_history_of_unknown_season(client):
+    assert client.get(reverse("standings_history", args=[1])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_team_page_query_count_is_independent_of_seasons(client):
+    season = create_active_season(4)
+    team = season.teams.first()
+    url = reverse("team_detail", args=[team.pk])
+    query_count = count_queries(client, url)
+
+    for year, active in [(2021, False), (2022, False), (2024, True)]:
+        other_season = Season.objects.create(
+            year=year, league=season.league, active=active
+        )
+        other_team = Team.objects.create(name=f"Rival {year}")
+        for member in (team, other_team):
+            SeasonTeam.objects.create(season=other_season, team=member)
+        other_season.generate_matches(datetime.date(year, 1, 1), 7)
+
+    assert count_queries(client, url) == query_count
+
+
+@pytest.mark.django_db
+def test_team_page_shows_recent_form(client):
+    season = create_active_season(2)
+    for match_day in season.match_days.filter(round_number__gt=1):
+        for match in match_day.matches.all():
+            match.status = Match.Status.IN_PROGRESS
+            match.save()
+            segment = match.segments.get(segment_number=1)
+            segment.home_score = 1
+            segment.save()
+            Match.objects.filter(pk=match.pk).update(status=Match.Status.FINISHED)
+
+    match = season.match_days.get(round_number=1).matches.get()
+    response = client.get(reverse("team_detail", args=[match.home_team_id]))
+
+    form = [result for _, result in response.context["recent_form"]]
+    assert form == ["W", "L"]
+
+
+@pytest.mark.django_db
+def test_leaderboard_and_player_page_read_player_stats(client):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=1).matches.get()
+    player = Player.objects.create(first_name="Ada", last_name="Lovelace")
+    match.segments.get(segment_type="S1").home_players.set([player])
+
+    response = client.get(reverse("leaderboard"))
+    rows = list(response.context["table"].rows)
+    assert [(row.record.player, row.record.singles_won) for row in rows] == [
+        (player, 1)
+    ]
+
+    response = client.get(reverse("player_detail", args=[player.pk]))
+    assert b"1-0 (1)" in response.content
+
+
+@pytest.mark.django_db
+def test_player_autocomplete(client):
+    for index in range(12):
+        Player.objects.create(first_name="Ana", last_name=f"Player {index:02}")
+    Player.objects.create(first_name="Bob", last_name="Anders")
+    url = reverse("player_autocomplete")
+
+    response = client.get(url, {"name": "ana"}, HTTP_HX_REQUEST="true")
+    assert response.content.count(b"<li>") == 10
+    assert b"Bob Anders" not in response.content
+
+    response = client.get(url, {"name": "anders"})
+    assert b"Bob Anders" in response.content
+    assert b"No players found." in client.get(url, {"name": "zz"}).content
+
+
+@pytest.mark.django_db
+def test_player_list_search(client):
+    Player.objects.create(first_name="Zoë", last_name="Adams")
+    Player.objects.create(first_name="Adam", last_name="Zola")
+
+    response = client.get(reverse("player_list"), {"name": "zoe"})
+
+    rows = list(response.context["table"].rows)
+    assert [row.record.first_name for row in rows] == ["Zoë"]
+    # The search input also asks for suggestions
+    assert f'hx-get="{reverse("player_autocomplete")}"'.encode() in response.content
+    assert b'id="player-suggestions"' in response.content
+
+
+@pytest.mark.django_db
+def test_match_detail_query_count_is_independent_of_lineups(client):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=1).matches.get()
+    url = reverse("match_detail", args=[match.pk])
+    query_count = count_queries(client, url)
+
+    for segment in match.segments.all():
+        for side in ("home", "away"):
+            getattr(segment, f"{side}_players").set(
+                [
+                    Player.objects.create(first_name=side, last_name=str(index))
+                    for index in range(2)
+                ]
+            )
+
+    assert count_queries(client, url) == query_count
+    assert b"home 1" in client.get(url).content
+    assert client.get(reverse("match_detail", args=[0])).status_code == 404
+
+
+def login_home_player(client, django_user_model, match):
+    """
+    Log in as a player of the home team of a match.
+    """
+    user = django_user_model.objects.create_user("captain", password="secret")
+    player = Player.objects.create(first_name="Cap", last_name="Tain", user=user)
+    SeasonTeam.objects.get(
+        season=match.match_day.season, team=match.home_team
+    ).players.add(player)
+    client.force_login(user)
+    return player
+
+
+@pytest.mark.django_db
+def test_lineup_page_query_count_is_independent_of_rosters(client, django_user_model):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=2).matches.get()
+    login_home_player(client, django_user_model, match)
+    squads = {
+        side: SeasonTeam.objects.get(season=season, team=getattr(match, f"{side}_team"))
+        for side in ("home", "away")
+    }
+    url = reverse("submit_lineup", args=[match.pk])
+    query_count = count_queries(client, url)
+
+    for side, squad in squads.items():
+        players = [
+            Player.objects.create(first_name=side, last_name=str(index))
+            for index in range(4)
+        ]
+        squad.players.add(*players)
+        for segment in match.segments.all():
+            getattr(segment, f"{side}_players").set(players[:2])
+
+    assert count_queries(client, url) == query_count
+    response = client.get(url)
+    assert response.content.count(b"home 3") == 7
+    assert response.content.count(b"Cap Tain") == 7
+    assert response.content.count(b" checked") == 14
+
+
+@pytest.mark.django_db
+def test_segment_score_is_saved_on_its_own(client, django_user_model):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=2).matches.get()
+    Match.objects.filter(pk=match.pk).update(status=Match.Status.IN_PROGRESS)
+    login_home_player(client, django_user_model, match)
+    url = reverse("submit_segment_score", args=[match.pk, 1])
+
+    response = client.patch(url, "home_score=7&away_score=3", HTTP_HX_REQUEST="true")
+
+    assert response.status_code == 200
+    assert response.content.count(b"<li") == 1
+    total = f'hx-swap-oob="true">\n    {match.home_team} 7 - 3 {match.away_team}'
+    assert total.encode() in response.content
+    assert b"Running total: 7 - 3" in response.content
+    match.refresh_from_db()
+    assert (match.home_total, match.away_total) == (7, 3)
+    assert match.segments.get(segment_number=1).home_score == 7
+
+    response = client.get(reverse("submit_score", args=[match.pk]))
+    assert response.content.count(b"hx-patch=") == 7
+
+
+@pytest.mark.django_db
+def test_segment_score_is_validated_against_the_running_total(
+    client, django_user_model
+):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=2).matches.get()
+    match.segments.filter(segment_number=1).update(home_score=7, away_score=0)
+    login_home_player(client, django_user_model, match)
+
+    response = client.patch(
+        reverse("submit_segment_score", args=[match.pk, 2]),
+        "home_score=8&away_score=0",
+        HTTP_HX_REQUEST="true",
+    )
+
+    assert response.status_code == 200
+    assert b"Score cannot exceed 14 for segment D2." in response.content
+    assert match.segments.get(segment_number=2).home_score is None
+
+
+@pytest.mark.django_db
+def test_segment_score_requires_a_player_of_the_match(client, django_user_model):
+    season = create_active_season(2)
+    match = season.match_days.get(round_number=2).matches.get()
+    url = reverse("submit_segment_score", args=[match.pk, 1])
+    user = django_user_model.objects.create_user("spectator", password="secret")
+    Player.objects.create(first_name="Spec", last_name="Tator", user=user)
+    client.force_login(user)
+
+    assert client.post(url, {"home_score": 7, "away_score": 0}).status_code == 403
+    assert client.get(url).status_code == 405
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_views_command():
+    create_active_season(2)
+
+    out = io.StringIO()
+    call_command(
+        "benchmark_views",
+        "--requests=20",
+        "--concurrency=5",
+        "--threads=2",
+        "--no-cache",
+        stdout=out,
+    )
+
+    output = out.getvalue()
+    assert "WSGI (2 threads):" in output
+    assert "ASGI:" in output
+    assert output.count(" 0 errors.") == 2
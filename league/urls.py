@@ -18,7 +18,18 @@ urlpatterns = [
         views.match_day_detail,
         name="match_day_detail",
     ),
+    path(
+        "match-days/<int:match_day_id>/matches/",
+        views.match_day_matches,
+        name="match_day_matches",
+    ),
+    path(
+        "match-days/<int:match_day_id>/events/",
+        views.match_day_events,
+        name="match_day_events",
+    ),
     path("matches/<int:pk>/", views.MatchDetailView.as_view(), name="match_detail"),
+    path("matches/<int:pk>/events/", views.match_events, name="match_events"),
     path("matches/<int:match_id>/start/", views.start_match, name="start_match"),
     # Submit score URL
     path(
@@ -26,6 +37,11 @@ urlpatterns = [
         views.SubmitScoreView.as_view(),
         name="submit_score",
     ),
+    path(
+        "matches/<int:match_id>/segments/<int:segment_number>/score/",
+        views.submit_segment_score,
+        name="submit_segment_score",
+    ),
     path(
         "matches/<int:match_id>/submit-lineup/",
         views.SubmitLineupView.as_view(),
@@ -35,11 +51,27 @@ urlpatterns = [
     path(
         "seasons/<int:season_id>/league-table/", views.league_table, name="league_table"
     ),
-    path("active-league/", views.ActiveLeagueView.as_view(), name="active_league"),
+    path(
+        "seasons/<int:season_id>/standings-history/",
+        views.standings_history,
+        name="standings_history",
+    ),
+    path("active-league/", views.active_league, name="active_league"),
     path("active-cup/", views.active_cup, name="active_cup"),
     # Player URLs
     path("players/", views.PlayerListView.as_view(), name="player_list"),
+    path(
+        "players/autocomplete/",
+        views.player_autocomplete,
+        name="player_autocomplete",
+    ),
     path("players/<int:player_id>/", views.player_detail, name="player_detail"),
+    path("leaderboard/", views.LeaderboardView.as_view(), name="leaderboard"),
+    path(
+        "seasons/<int:season_id>/leaderboard/",
+        views.LeaderboardView.as_view(),
+        name="season_leaderboard",
+    ),
     # Login URLs
     path("login-form/", views.login_modal_view, name="login_form"),
 ]
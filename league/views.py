@@ -1,171 +1,314 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Prefetch, Sum
-from django.forms import modelformset_factory
-from django.http import HttpResponse
+from django.db.models import Prefetch
+from django.forms import BaseModelFormSet, modelformset_factory
+from django.http import Http404, HttpResponse, JsonResponse, QueryDict
 from django.http.response import HttpResponseForbidden
-from django.shortcuts import get_object_or_404, redirect, render
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
-from django.views.decorators.http import require_POST
-from django.views.generic import DetailView, ListView, TemplateView
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.views.decorators.http import require_http_methods, require_POST
+from django.views.generic import DetailView, ListView
 from django.views.generic.edit import FormView
 from django_filters.views import FilterView
-from django_tables2 import SingleTableMixin
+from django_tables2 import RequestConfig, SingleTableMixin
 from allauth.account.forms import LoginForm
 
 from league.filter import PlayerFilter
 
-from .forms import SegmentLineupForm, SegmentScoreForm
+from .cache import ALL_SEASONS, acached_content, cached_content, cached_value
+from .conditional import (
+    aactive_league_last_modified,
+    amatch_day_last_modified,
+    conditional_page,
+    match_day_last_modified,
+    match_last_modified,
+    team_last_modified,
+)
+from .forms import SegmentFormSet, SegmentLineupForm, SegmentScoreForm
+from .helper import build_standings_history
+from .live import (
+    event_stream_response,
+    live_scores_enabled,
+    match_day_topic,
+    match_topic,
+)
+from .pagination import KeysetPaginationMixin
+from .scorecard import Scorecard
+from .signals import deferred_match_updates
 from .models import (
     LeagueTable,
     Match,
     MatchDay,
     Player,
+    PlayerSeasonStats,
     Season,
     SeasonTeam,
     SegmentScore,
     Team,
 )
-from .tables import LeagueTableTable, PlayerTable, SegmentTable, TeamTable
+from .tables import (
+    LeagueTableTable,
+    PlayerStatsTable,
+    PlayerTable,
+    SegmentTable,
+    TeamTable,
+)
 
+RECENT_FORM_LENGTH = 5
+AUTOCOMPLETE_LIMIT = 10
 
-def home(request):
-    today = timezone.now().date()
-    previous_match_day = (
-        MatchDay.objects.filter(date__lte=today)
-        .order_by("date")
-        .prefetch_related("matches__home_team", "matches__away_team")
-        .first()
-    )
 
-    next_match_day = (
-        MatchDay.objects.filter(date__gt=today)
-        .order_by("date")
-        .prefetch_related("matches__home_team", "matches__away_team")
-        .first()
-    )
+class CachedContentMixin:
+    """
+    Serve the content of the page from the versioned page cache. The layout
+    around it is rendered for every request.
+    """
 
-    context = {
-        "previous_match_day": previous_match_day,
-        "next_match_day": next_match_day,
-    }
+    def get_cache_season_id(self):
+        return ALL_SEASONS
 
-    return render(request, "league/home.html", context)
+    def get_content_context(self, **kwargs):
+        return self.get_context_data(**kwargs)
 
+    def get(self, request, *args, **kwargs):
+        content = cached_content(
+            request,
+            self.get_template_names(),
+            lambda: self.get_content_context(**kwargs),
+            self.get_cache_season_id(),
+        )
+        if request.htmx:
+            return HttpResponse(content)
+        return render(request, "league/page.html", {"content": content})
+
+
+async def arender(request, template_name, context):
+    """
+    Render a page from an async view. The context must be fully loaded, and
+    the visitor shown in the layout is loaded beforehand, as the template
+    cannot query the database from the event loop.
+    """
+    return render(request, template_name, {**context, "user": await request.auser()})
+
+
+async def home(request):
+    async def get_context():
+        today = timezone.now().date()
+        matches = Prefetch("matches", queryset=Match.objects.with_scores())
+        previous_match_day = (
+            await MatchDay.objects.filter(date__lte=today)
+            .order_by("date")
+            .prefetch_related(matches)
+            .afirst()
+        )
 
-class TeamListView(SingleTableMixin, ListView):
+        next_match_day = (
+            await MatchDay.objects.filter(date__gt=today)
+            .order_by("date")
+            .prefetch_related(matches)
+            .afirst()
+        )
+
+        return {
+            "previous_match_day": previous_match_day,
+            "next_match_day": next_match_day,
+        }
+
+    content = await acached_content(request, "league/partials/home.html", get_context)
+    return await arender(request, "league/page.html", {"content": content})
+
+
+class TeamListView(
+    CachedContentMixin, KeysetPaginationMixin, SingleTableMixin, ListView
+):
     queryset = Team.objects.all().select_related("venue")
     table_class = TeamTable
-    paginate_by = 10
 
     def get_template_names(self):
         if self.request.htmx:
             template_name = "league/partials/table.html"
         else:
-            template_name = "league/team_list.html"
+            template_name = "league/partials/team_list.html"
 
         return template_name
 
+    def get_content_context(self, **kwargs):
+        self.object_list = self.get_queryset()
+        return self.get_context_data(**kwargs)
+
 
+@conditional_page(team_last_modified)
 def team_detail(request, team_id):
-    season_teams = (
-        SeasonTeam.objects.filter(team_id=team_id, season__active=True)
-        .select_related("season", "team", "team__venue")
-        .prefetch_related("players", "team__home_matches", "team__away_matches")
+    team = get_object_or_404(Team.objects.select_related("venue"), pk=team_id)
+    season_teams = list(
+        SeasonTeam.objects.filter(team=team, season__active=True)
+        .select_related("season__league")
+        .prefetch_related("players")
     )
-    season = season_teams.first().season
-    team = season_teams.first().team
+    matches = list(
+        team.get_schedule(*[season_team.season for season_team in season_teams])
+    )
+    results = [
+        (match, match.result_for(team))
+        for match in matches
+        if match.status == Match.Status.FINISHED
+    ]
     return render(
         request,
         "league/team_detail.html",
         {
             "team": team,
             "season_teams": season_teams,
-            "matches": team.get_schedule(season),
+            "matches": matches,
+            "recent_form": results[-RECENT_FORM_LENGTH:],
         },
     )
 
 
-def match_day_list(request, season_id):
-    season = get_object_or_404(Season, pk=season_id)
-    match_days = season.match_days.all()
-    return render(
+async def match_day_list(request, season_id):
+    season = await aget_object_or_404(
+        Season.objects.select_related("league"), pk=season_id
+    )
+    match_days = [match_day async for match_day in season.match_days.with_progress()]
+    return await arender(
         request,
         "league/match_day_list.html",
         {"match_days": match_days, "season": season},
     )
 
 
-def match_day_detail(request, match_day_id):
-    match_day = get_object_or_404(MatchDay, pk=match_day_id)
-    matches = match_day.matches.all()
-    return render(
-        request,
-        "league/match_day_detail.html",
-        {"match_day": match_day, "matches": matches},
+@conditional_page(amatch_day_last_modified)
+async def match_day_detail(request, match_day_id):
+    season_id = await aget_object_or_404(
+        MatchDay.objects.values_list("season_id", flat=True), pk=match_day_id
     )
 
+    async def get_context():
+        match_day = await MatchDay.objects.aget(pk=match_day_id)
+        matches = [match async for match in match_day.matches.with_scores()]
+        return {
+            "match_day": match_day,
+            "matches": matches,
+            "live_scores": live_scores_enabled(request),
+        }
+
+    content = await acached_content(
+        request, "league/partials/match_day_detail.html", get_context, season_id
+    )
+    return await arender(request, "league/page.html", {"content": content})
+
+
+@conditional_page(match_day_last_modified)
+def match_day_matches(request, match_day_id):
+    season_id = get_object_or_404(
+        MatchDay.objects.values_list("season_id", flat=True), pk=match_day_id
+    )
+
+    def get_context():
+        return {
+            "matches": Match.objects.with_scores().filter(match_day_id=match_day_id)
+        }
+
+    content = cached_content(
+        request, "league/partials/match_day_matches.html", get_context, season_id
+    )
+    return HttpResponse(content)
 
+
+@method_decorator(conditional_page(match_last_modified), name="get")
 class MatchDetailView(SingleTableMixin, DetailView):
     model = Match
     table_class = SegmentTable
     template_name = "league/match_detail.html"
 
-    def get_table_data(self):
-        match = self.get_object()
-        return match.segments.all()
-
+    @cached_property
+    def scorecard(self):
+        try:
+            return Scorecard.load(self.kwargs["pk"])
+        except Match.DoesNotExist:
+            raise Http404("No match found matching the query")
 
-class ActiveLeagueView(SingleTableMixin, TemplateView):
-    table_class = LeagueTableTable
+    def get_object(self, queryset=None):
+        return self.scorecard.match
 
-    def get_template_names(self):
-        if self.request.htmx:
-            template_name = "league/partials/table.html"
-        else:
-            template_name = "league/active_league.html"
-
-        return template_name
+    def get_table_data(self):
+        return self.scorecard.segments
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["season"] = (
-            Season.objects.filter(active=True, league__type="regular")
-            .prefetch_related(
-                "match_days",
-                Prefetch(
-                    "match_days__matches",
-                    queryset=Match.objects.annotate(
-                        total_home_score=Sum("segments__home_score"),
-                        total_away_score=Sum("segments__away_score"),
-                    ).prefetch_related("home_team", "away_team"),
-                ),
-            )
-            .first()
-        )
+        context["scorecard"] = self.scorecard
+        context["live_scores"] = live_scores_enabled(self.request)
         return context
 
-    def get_table_data(self):
-        active_league_table = (
-            LeagueTable.objects.filter(
-                match_day__season__active=True,
-                match_day__season__league__type="regular",
-            )
-            .select_related("team", "match_day")
-            .all()
+
+@conditional_page(aactive_league_last_modified)
+async def active_league(request):
+    active_seasons = Season.objects.filter(active=True, league__type="regular")
+    season_id = await active_seasons.values_list("pk", flat=True).afirst()
+
+    async def get_context():
+        # The matches of a match day are loaded when it is opened
+        season = (
+            await active_seasons.select_related("league")
+            .prefetch_related("match_days")
+            .afirst()
         )
-        return active_league_table
+        standings = LeagueTable.objects.current_standings(
+            active_seasons.values("pk")[:1]
+        ).select_related("team")
+        # The table sorts and paginates the loaded rows in memory
+        table = LeagueTableTable([standing async for standing in standings])
+        RequestConfig(request).configure(table)
+        return {"season": season, "table": table}
+
+    if request.htmx:
+        template_name = "league/partials/table.html"
+    else:
+        template_name = "league/partials/active_league.html"
+    content = await acached_content(
+        request, template_name, get_context, season_id or ALL_SEASONS
+    )
+    if request.htmx:
+        return HttpResponse(content)
+    return await arender(request, "league/page.html", {"content": content})
 
 
 def active_cup(request):
     season = Season.objects.filter(active=True, league__type="cup").first()
-    return render(request, "league/active_league.html", {"season": season})
+    content = render_to_string(
+        "league/partials/active_league.html", {"season": season}, request
+    )
+    return render(request, "league/page.html", {"content": content})
+
+
+def get_team_and_role(user, match) -> tuple[str, Team] | tuple[None, None]:
+    """
+    Return the side and the team of the user in a match, if they play in it.
+    """
+    try:
+        player = user.player
+    except Player.DoesNotExist:
+        return None, None
+
+    season = match.match_day.season
+    current_team = player.get_current_team(season)
+
+    if current_team == match.home_team:
+        return "home", current_team
+    elif current_team == match.away_team:
+        return "away", current_team
+    else:
+        return None, None
 
 
 class SubmitView(LoginRequiredMixin, FormView):
     template_name = None
     _form = None
+    _formset = BaseModelFormSet
 
     def dispatch(self, request, *args, **kwargs):
         """
@@ -183,35 +326,32 @@ class SubmitView(LoginRequiredMixin, FormView):
         return super().dispatch(request, *args, **kwargs)
 
     def get_form_class(self):
-        return modelformset_factory(SegmentScore, form=self._form, extra=0)
+        return modelformset_factory(
+            SegmentScore, form=self._form, formset=self._formset, extra=0
+        )
 
     def get_match(self):
-        return get_object_or_404(Match, id=self.kwargs["match_id"])
+        if not hasattr(self, "_match"):
+            self._match = get_object_or_404(
+                Match.objects.select_related("match_day", "home_team", "away_team"),
+                id=self.kwargs["match_id"],
+            )
+        return self._match
 
     def get_team_and_role(self) -> tuple[str, Team] | tuple[None, None]:
         """
         Return the user's team for the current season by checking the Player model.
         """
-        match = self.get_match()
-
-        try:
-            player = self.request.user.player
-        except Player.DoesNotExist:
-            return None, None
-
-        season = match.match_day.season
-        current_team = player.get_current_team(season)
-
-        if current_team == match.home_team:
-            return "home", current_team
-        elif current_team == match.away_team:
-            return "away", current_team
-        else:
-            return None, None
+        return get_team_and_role(self.request.user, self.get_match())
 
     def get_queryset(self):
         match = self.get_match()
-        return SegmentScore.objects.filter(match=match).order_by("segment_number")
+        return (
+            SegmentScore.objects.filter(match=match)
+            .with_running_totals()
+            .select_related("match")
+            .order_by("segment_number")
+        )
 
     def get_form_kwargs(self):
         """
@@ -225,7 +365,8 @@ class SubmitView(LoginRequiredMixin, FormView):
         """
         Handle valid formset submission.
         """
-        formset.save()  # Save all the forms in the formset
+        with deferred_match_updates():
+            formset.save()  # Save all the forms in the formset
         return redirect(self.get_success_url())
 
     def form_invalid(self, formset):
@@ -269,6 +410,10 @@ class SubmitScoreView(SubmitView):
 class SubmitLineupView(SubmitView):
     template_name = "league/submit_lineup.html"
     _form = SegmentLineupForm
+    _formset = SegmentFormSet
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related("home_players", "away_players")
 
     def get_restricted_formset(self, team_role):
         """
@@ -285,6 +430,46 @@ class SubmitLineupView(SubmitView):
         return formset
 
 
+@login_required
+@require_http_methods(["PATCH", "POST"])
+def submit_segment_score(request, match_id, segment_number):
+    """
+    Save the score of a single segment and answer with its row and the match
+    total, so a scorer does not post the whole formset after every segment.
+    """
+    match = get_object_or_404(
+        Match.objects.select_related("match_day", "home_team", "away_team"),
+        pk=match_id,
+    )
+    team_role, _ = get_team_and_role(request.user, match)
+    if not team_role:
+        return HttpResponseForbidden("You are not authorized to submit for that match.")
+
+    # The running totals are computed over all segments of the match
+    segments = match.segments.with_running_totals().order_by("segment_number")
+    segment = next(
+        (segment for segment in segments if segment.segment_number == segment_number),
+        None,
+    )
+    if segment is None:
+        raise Http404("No such segment.")
+
+    data = request.POST if request.method == "POST" else QueryDict(request.body)
+    form = SegmentScoreForm(data, instance=segment)
+    if form.is_valid():
+        # The signals update the totals and the status of `match` itself, the
+        # match of the segments loaded through it
+        form.save()
+        if not request.htmx:
+            return redirect("submit_score", match_id=match.pk)
+
+    return render(
+        request,
+        "league/partials/segment_score_row.html",
+        {"form": form, "segment": segment, "match": match, "update_total": True},
+    )
+
+
 @login_required
 def submit_score(request, match_id):
     match = get_object_or_404(Match, pk=match_id)
@@ -294,19 +479,28 @@ def submit_score(request, match_id):
     return render(request, "league/submit_score.html", {"match": match})
 
 
+def standings_history(request, season_id):
+    history = cached_value(
+        request, lambda: build_standings_history(season_id), season_id
+    )
+    if not history["rounds"]:
+        # Only an unknown season is worth the extra query
+        get_object_or_404(Season, pk=season_id)
+    return JsonResponse(history)
+
+
 def league_table(request, season_id):
     season = get_object_or_404(Season, pk=season_id)
-    table = season.league_table.all().order_by("-points")
+    table = LeagueTable.objects.current_standings(season).select_related("team")
     return render(
         request, "league/league_table.html", {"table": table, "season": season}
     )
 
 
-class PlayerListView(SingleTableMixin, FilterView):
+class PlayerListView(KeysetPaginationMixin, SingleTableMixin, FilterView):
     table_class = PlayerTable
     filterset_class = PlayerFilter
-    queryset = Player.objects.all()
-    paginate_by = 10
+    queryset = Player.objects.order_by("last_name", "first_name")
 
     def get_template_names(self):
         if self.request.htmx:
@@ -317,9 +511,86 @@ class PlayerListView(SingleTableMixin, FilterView):
         return template_name
 
 
-def player_detail(request, player_id):
-    player = get_object_or_404(Player, pk=player_id)
-    return render(request, "league/player_detail.html", {"player": player})
+def player_autocomplete(request):
+    # Reads the search input of the player list, named after its filter
+    query = request.GET.get("name", "")
+    players = (
+        Player.objects.search(query).order_by("search_name")[:AUTOCOMPLETE_LIMIT]
+        if query.strip()
+        else Player.objects.none()
+    )
+    return render(
+        request,
+        "league/partials/player_autocomplete.html",
+        {"players": players, "query": query},
+    )
+
+
+async def player_detail(request, player_id):
+    player = await aget_object_or_404(Player, pk=player_id)
+    season_stats = [
+        stats
+        async for stats in player.season_stats.select_related(
+            "season__league"
+        ).order_by("-season__year")
+    ]
+    return await arender(
+        request,
+        "league/player_detail.html",
+        {"player": player, "season_stats": season_stats},
+    )
+
+
+class LeaderboardView(SingleTableMixin, ListView):
+    table_class = PlayerStatsTable
+    paginate_by = 20
+
+    def get_queryset(self):
+        return PlayerSeasonStats.objects.filter(season=self.season).select_related(
+            "player"
+        )
+
+    @cached_property
+    def season(self):
+        seasons = Season.objects.select_related("league")
+        if "season_id" in self.kwargs:
+            return get_object_or_404(seasons, pk=self.kwargs["season_id"])
+        season = seasons.filter(active=True, league__type="regular").first()
+        if season is None:
+            raise Http404("There is no active league season.")
+        return season
+
+    def get_template_names(self):
+        if self.request.htmx:
+            template_name = "league/partials/table.html"
+        else:
+            template_name = "league/leaderboard.html"
+
+        return template_name
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["season"] = self.season
+        return context
+
+
+async def match_events(request, pk):
+    """
+    Stream the segment scores and the status of a match as Server-Sent Events.
+    """
+    if not await Match.objects.filter(pk=pk).aexists():
+        raise Http404("No such match.")
+    return event_stream_response(request, match_topic(pk))
+
+
+async def match_day_events(request, match_day_id):
+    """
+    Stream the scores and statuses of the matches of a match day as
+    Server-Sent Events.
+    """
+    if not await MatchDay.objects.filter(pk=match_day_id).aexists():
+        raise Http404("No such match day.")
+    return event_stream_response(request, match_day_topic(match_day_id))
 
 
 @require_POST